@@ -171,10 +171,22 @@ if [ ! -f "$MT5_EXE" ]; then
     fi
 fi
 
-# --- 5. rpyc bridge server (Wine Python) ---
-echo "[5/6] Starting rpyc bridge server..."
+# Cache the resolved path so the worker skips its own search of the prefix
+echo "$MT5_EXE" > "$WINEPREFIX/.terminal_path"
+
+# Standby terminal install for zero-downtime recycling (second instance needs its own directory)
+MT5_DIR=$(dirname "$MT5_EXE")
+if [ ! -f "$MT5_DIR Standby/terminal64.exe" ]; then
+    echo "       Creating standby terminal install at $MT5_DIR Standby"
+    cp -r "$MT5_DIR" "$MT5_DIR Standby"
+fi
+
+# --- 5. rpyc bridge servers (Wine Python): active + standby terminal ---
+echo "[5/6] Starting rpyc bridge servers..."
 wine64 "$WIN_PYTHON" /opt/scripts/rpyc_server.py &
 RPYC_PID=$!
+RPYC_PORT=18813 wine64 "$WIN_PYTHON" /opt/scripts/rpyc_server.py &
+RPYC_STANDBY_PID=$!
 
 # Wait for rpyc server to be ready (up to 60s)
 for i in $(seq 1 30); do
@@ -200,6 +212,7 @@ cleanup() {
     echo "Shutting down worker $WORKER_ID..."
     kill $WORKER_PID 2>/dev/null || true
     kill $RPYC_PID 2>/dev/null || true
+    kill $RPYC_STANDBY_PID 2>/dev/null || true
     kill $XVFB_PID 2>/dev/null || true
     wait $WORKER_PID 2>/dev/null || true
     wait $RPYC_PID 2>/dev/null || true
@@ -217,7 +230,7 @@ else
 fi
 WORKER_PID=$!
 
-echo "=== Worker $WORKER_ID running (PID $WORKER_PID, rpyc PID $RPYC_PID) ==="
+echo "=== Worker $WORKER_ID running (PID $WORKER_PID, rpyc PIDs $RPYC_PID/$RPYC_STANDBY_PID) ==="
 
 # Wait for worker to finish
 wait $WORKER_PID
@@ -0,0 +1,5 @@
+-- Candle gap scanner coverage
+-- candle_data_since: start of the verified candle history for the symbol
+-- candle_verified_until: gap scanner has verified/backfilled all timeframes up to here
+
+ALTER TABLE public.hot_symbols ADD COLUMN IF NOT EXISTS candle_verified_until TIMESTAMPTZ;
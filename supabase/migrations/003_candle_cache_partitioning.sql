@@ -0,0 +1,125 @@
+-- Tiered retention and partitioning for candle_cache
+--
+-- candle_cache is list-partitioned by timeframe, and each timeframe is
+-- range-partitioned by month or year. Old bars are removed by dropping whole
+-- partitions in public.maintain_candle_partitions(), which the market data
+-- worker calls once a day. The (symbol, timeframe, timestamp) primary key keeps
+-- the worker's on_conflict="symbol,timeframe,timestamp" upserts working and
+-- replaces both the old unique index and idx_candles_lookup.
+
+-- ============================================================
+-- 1. RETENTION RULES
+-- ============================================================
+CREATE TABLE public.candle_retention (
+    timeframe TEXT PRIMARY KEY,
+    partition_unit TEXT NOT NULL CHECK (partition_unit IN ('month', 'year')),
+    retention INTERVAL NOT NULL
+);
+
+-- M30 keeps a month beyond CANDLE_HISTORY_MONTHS so worker backfills always land in a partition
+INSERT INTO public.candle_retention (timeframe, partition_unit, retention) VALUES
+    ('M30', 'month', '7 months'),
+    ('H1', 'month', '1 year'),
+    ('H4', 'month', '2 years'),
+    ('D1', 'year', '10 years'),
+    ('W1', 'year', '10 years');
+
+ALTER TABLE public.candle_retention ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================
+-- 2. PARTITIONED TABLE
+-- ============================================================
+CREATE TABLE public.candle_cache_new (
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL CHECK (timeframe IN ('M30', 'H1', 'H4', 'D1', 'W1')),
+    timestamp TIMESTAMPTZ NOT NULL,
+    open DECIMAL(15,6) NOT NULL,
+    high DECIMAL(15,6) NOT NULL,
+    low DECIMAL(15,6) NOT NULL,
+    close DECIMAL(15,6) NOT NULL,
+    volume DECIMAL(15,2) DEFAULT 0,
+    PRIMARY KEY (symbol, timeframe, timestamp)
+) PARTITION BY LIST (timeframe);
+
+CREATE TABLE public.candle_cache_m30 PARTITION OF public.candle_cache_new FOR VALUES IN ('M30') PARTITION BY RANGE (timestamp);
+CREATE TABLE public.candle_cache_h1 PARTITION OF public.candle_cache_new FOR VALUES IN ('H1') PARTITION BY RANGE (timestamp);
+CREATE TABLE public.candle_cache_h4 PARTITION OF public.candle_cache_new FOR VALUES IN ('H4') PARTITION BY RANGE (timestamp);
+CREATE TABLE public.candle_cache_d1 PARTITION OF public.candle_cache_new FOR VALUES IN ('D1') PARTITION BY RANGE (timestamp);
+CREATE TABLE public.candle_cache_w1 PARTITION OF public.candle_cache_new FOR VALUES IN ('W1') PARTITION BY RANGE (timestamp);
+
+ALTER TABLE public.candle_cache RENAME TO candle_cache_old;
+ALTER TABLE public.candle_cache_new RENAME TO candle_cache;
+
+-- ============================================================
+-- 3. PARTITION MAINTENANCE
+-- ============================================================
+-- Creates range partitions covering each timeframe's retention window plus the
+-- next period, and drops partitions that lie entirely outside the window.
+-- Returns the number of partitions dropped.
+CREATE OR REPLACE FUNCTION public.maintain_candle_partitions()
+RETURNS INTEGER AS $$
+DECLARE
+    r RECORD;
+    part RECORD;
+    parent TEXT;
+    step INTERVAL;
+    fmt TEXT;
+    window_start TIMESTAMPTZ;
+    bucket TIMESTAMPTZ;
+    dropped INTEGER := 0;
+BEGIN
+    FOR r IN SELECT * FROM public.candle_retention LOOP
+        parent := 'candle_cache_' || lower(r.timeframe);
+        step := ('1 ' || r.partition_unit)::INTERVAL;
+        fmt := CASE r.partition_unit WHEN 'year' THEN 'YYYY' ELSE 'YYYY_MM' END;
+        window_start := date_trunc(r.partition_unit, NOW() - r.retention, 'UTC');
+
+        bucket := window_start;
+        WHILE bucket <= NOW() + step LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.%I FOR VALUES FROM (%L) TO (%L)',
+                parent || '_' || to_char(bucket AT TIME ZONE 'UTC', fmt), parent, bucket, bucket + step
+            );
+            bucket := bucket + step;
+        END LOOP;
+
+        FOR part IN
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = ('public.' || parent)::regclass
+        LOOP
+            IF (to_timestamp(right(part.relname, length(fmt)), fmt)::TIMESTAMP AT TIME ZONE 'UTC') + step <= window_start THEN
+                EXECUTE format('DROP TABLE public.%I', part.relname);
+                dropped := dropped + 1;
+            END IF;
+        END LOOP;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- DDL as definer: only the market data worker (service role) may run it over RPC
+REVOKE EXECUTE ON FUNCTION public.maintain_candle_partitions() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.maintain_candle_partitions() TO service_role;
+
+SELECT public.maintain_candle_partitions();
+
+-- ============================================================
+-- 4. DATA COPY (only bars inside the retention window)
+-- ============================================================
+INSERT INTO public.candle_cache (symbol, timeframe, timestamp, open, high, low, close, volume)
+SELECT o.symbol, o.timeframe, o.timestamp, o.open, o.high, o.low, o.close, o.volume
+FROM public.candle_cache_old o
+JOIN public.candle_retention r ON r.timeframe = o.timeframe
+WHERE o.timestamp >= date_trunc(r.partition_unit, NOW() - r.retention, 'UTC')
+  AND o.timestamp < NOW() + ('1 ' || r.partition_unit)::INTERVAL
+ON CONFLICT DO NOTHING;
+
+DROP TABLE public.candle_cache_old;
+
+-- ============================================================
+-- 5. ROW LEVEL SECURITY
+-- ============================================================
+ALTER TABLE public.candle_cache ENABLE ROW LEVEL SECURITY;
+CREATE POLICY candles_select ON public.candle_cache FOR SELECT TO authenticated USING (true);
@@ -0,0 +1,132 @@
+-- Incremental analytics state
+--
+-- analytics_state holds running aggregates per (account, period) that the sync
+-- engine folds newly closed trades into (see sync-engine/analytics.py). The
+-- per-row invalidate_analytics_cache trigger, which deleted a user's whole cache
+-- once per written row, is replaced by statement-level triggers that only flag
+-- an account for a full rebuild when already-folded history is edited or
+-- deleted, or when a closed trade lands behind the fold watermark.
+
+-- ============================================================
+-- 1. ANALYTICS STATE
+-- ============================================================
+CREATE TABLE public.analytics_state (
+    user_id UUID NOT NULL REFERENCES public.profiles(id) ON DELETE CASCADE,
+    account_id UUID NOT NULL REFERENCES public.accounts(id) ON DELETE CASCADE,
+    period TEXT NOT NULL CHECK (period IN ('today', 'week', 'month', 'year', 'all')),
+    period_start TIMESTAMPTZ,
+    total_trades INTEGER NOT NULL DEFAULT 0,
+    winning_trades INTEGER NOT NULL DEFAULT 0,
+    losing_trades INTEGER NOT NULL DEFAULT 0,
+    gross_win DOUBLE PRECISION NOT NULL DEFAULT 0,
+    gross_loss DOUBLE PRECISION NOT NULL DEFAULT 0,
+    largest_win DOUBLE PRECISION NOT NULL DEFAULT 0,
+    largest_loss DOUBLE PRECISION NOT NULL DEFAULT 0,
+    equity DOUBLE PRECISION NOT NULL DEFAULT 0,
+    peak_equity DOUBLE PRECISION NOT NULL DEFAULT 0,
+    max_drawdown DOUBLE PRECISION NOT NULL DEFAULT 0,
+    max_drawdown_pct DOUBLE PRECISION NOT NULL DEFAULT 0,
+    current_win_streak INTEGER NOT NULL DEFAULT 0,
+    current_loss_streak INTEGER NOT NULL DEFAULT 0,
+    max_win_streak INTEGER NOT NULL DEFAULT 0,
+    max_loss_streak INTEGER NOT NULL DEFAULT 0,
+    duration_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    duration_count INTEGER NOT NULL DEFAULT 0,
+    symbol_pnl JSONB NOT NULL DEFAULT '{}',
+    session_pnl JSONB NOT NULL DEFAULT '{}',
+    last_exit_timestamp TIMESTAMPTZ,
+    last_ticket TEXT,
+    needs_rebuild BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (account_id, period)
+);
+
+ALTER TABLE public.analytics_state ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================
+-- 2. STATEMENT-LEVEL INVALIDATION
+-- ============================================================
+DROP TRIGGER IF EXISTS on_trade_change ON public.trades;
+DROP FUNCTION IF EXISTS public.invalidate_analytics_cache();
+
+CREATE OR REPLACE FUNCTION public.flag_analytics_rebuild(account_ids UUID[])
+RETURNS VOID AS $$
+BEGIN
+    IF account_ids IS NULL OR cardinality(account_ids) = 0 THEN
+        RETURN;
+    END IF;
+    UPDATE public.analytics_state SET needs_rebuild = TRUE WHERE account_id = ANY(account_ids);
+    DELETE FROM public.analytics_cache WHERE account_id = ANY(account_ids);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the trigger functions below (running as definer) call this; keep it off /rpc
+REVOKE EXECUTE ON FUNCTION public.flag_analytics_rebuild(UUID[]) FROM PUBLIC, anon, authenticated;
+
+-- Inserts: only closed trades at or behind the watermark need a rebuild;
+-- anything newer is folded by the next refresh
+CREATE OR REPLACE FUNCTION public.analytics_on_trades_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM public.flag_analytics_rebuild(ARRAY(
+        SELECT DISTINCT n.account_id
+        FROM new_trades n
+        JOIN public.analytics_state s ON s.account_id = n.account_id AND s.period = 'all'
+        WHERE n.status = 'closed'
+          AND (n.exit_timestamp, n.ticket_number) <= (s.last_exit_timestamp, s.last_ticket)
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Updates: a rebuild is needed when a field analytics reads changed on a row
+-- that was already folded, or that now sits behind the watermark
+CREATE OR REPLACE FUNCTION public.analytics_on_trades_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM public.flag_analytics_rebuild(ARRAY(
+        SELECT DISTINCT n.account_id
+        FROM new_trades n
+        JOIN old_trades o ON o.id = n.id
+        JOIN public.analytics_state s ON s.account_id = n.account_id AND s.period = 'all'
+        WHERE (o.pnl, o.status, o.exit_timestamp, o.entry_timestamp, o.symbol, o.session_tag, o.account_id)
+              IS DISTINCT FROM
+              (n.pnl, n.status, n.exit_timestamp, n.entry_timestamp, n.symbol, n.session_tag, n.account_id)
+          AND (
+              (o.status = 'closed' AND (o.exit_timestamp, o.ticket_number) <= (s.last_exit_timestamp, s.last_ticket))
+              OR (n.status = 'closed' AND (n.exit_timestamp, n.ticket_number) <= (s.last_exit_timestamp, s.last_ticket))
+          )
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Deletes: removing an already-folded trade needs a rebuild
+CREATE OR REPLACE FUNCTION public.analytics_on_trades_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM public.flag_analytics_rebuild(ARRAY(
+        SELECT DISTINCT o.account_id
+        FROM old_trades o
+        JOIN public.analytics_state s ON s.account_id = o.account_id AND s.period = 'all'
+        WHERE o.status = 'closed'
+          AND (o.exit_timestamp, o.ticket_number) <= (s.last_exit_timestamp, s.last_ticket)
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE TRIGGER on_trades_insert
+    AFTER INSERT ON public.trades
+    REFERENCING NEW TABLE AS new_trades
+    FOR EACH STATEMENT EXECUTE FUNCTION public.analytics_on_trades_insert();
+
+CREATE TRIGGER on_trades_update
+    AFTER UPDATE ON public.trades
+    REFERENCING OLD TABLE AS old_trades NEW TABLE AS new_trades
+    FOR EACH STATEMENT EXECUTE FUNCTION public.analytics_on_trades_update();
+
+CREATE TRIGGER on_trades_delete
+    AFTER DELETE ON public.trades
+    REFERENCING OLD TABLE AS old_trades
+    FOR EACH STATEMENT EXECUTE FUNCTION public.analytics_on_trades_delete();
@@ -0,0 +1,27 @@
+-- Login failure accounting in one round trip
+--
+-- The trade worker used to fetch an account and then PATCH it back with
+-- sync_fail_count + 1 on every failed MT5 login. record_login_failure() does
+-- the increment (and the auto-disable after 3 consecutive failures) in a
+-- single atomic UPDATE, so concurrent workers cannot lose a count.
+
+CREATE OR REPLACE FUNCTION public.record_login_failure(p_account_id UUID, p_error TEXT)
+RETURNS INTEGER AS $$
+DECLARE
+    fail_count INTEGER;
+BEGIN
+    UPDATE public.accounts
+    SET last_sync_status = 'error',
+        last_sync_error = left(p_error, 500),
+        sync_fail_count = sync_fail_count + 1,
+        sync_enabled = sync_enabled AND sync_fail_count + 1 < 3
+    WHERE id = p_account_id
+    RETURNING sync_fail_count INTO fail_count;
+    RETURN fail_count;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the sync engine (service role) may record failures; PostgREST would
+-- otherwise expose this definer function to anon/authenticated callers
+REVOKE EXECUTE ON FUNCTION public.record_login_failure(UUID, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.record_login_failure(UUID, TEXT) TO service_role;
@@ -0,0 +1,22 @@
+-- Market holidays for the per-symbol session calendar
+--
+-- The market data worker learns each symbol's weekly trading hours from its
+-- recent M30 bars (see sync-engine/sessions.py). Closures that bars cannot
+-- predict (exchange holidays, early closes) are listed here as UTC ranges,
+-- matched against symbols with a glob pattern, e.g.
+--   ('US30*', '2026-11-26 00:00+00', '2026-11-27 00:00+00', 'Thanksgiving')
+--   ('*',     '2026-12-25 00:00+00', '2026-12-26 00:00+00', 'Christmas Day')
+
+CREATE TABLE public.market_holidays (
+    id BIGSERIAL PRIMARY KEY,
+    symbol_pattern TEXT NOT NULL DEFAULT '*',
+    starts_at TIMESTAMPTZ NOT NULL,
+    ends_at TIMESTAMPTZ NOT NULL,
+    description TEXT,
+    CHECK (ends_at > starts_at)
+);
+
+CREATE INDEX idx_market_holidays_ends_at ON public.market_holidays(ends_at);
+
+ALTER TABLE public.market_holidays ENABLE ROW LEVEL SECURITY;
+CREATE POLICY market_holidays_select ON public.market_holidays FOR SELECT TO authenticated USING (true);
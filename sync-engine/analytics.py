@@ -0,0 +1,277 @@
+"""
+Analytics engine — keeps analytics_cache current from closed trades.
+
+Each (account, period) has a running aggregate row in analytics_state: sums,
+counts, equity/peak/drawdown, streak counters and per-symbol/per-session P&L,
+plus the (exit_timestamp, ticket_number) watermark of the last folded trade.
+Newly closed trades past the watermark are pulled as columns and folded in
+with NumPy, so a refresh costs O(new trades). A period is rebuilt from scratch
+only when the statement-level trade triggers flag it (a historical row was
+edited or deleted, or a trade landed behind the watermark) or when its window
+rolls over. Metric definitions match computeAnalytics() in the web app.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import database as db
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+
+
+def period_starts(now: datetime) -> dict[str, datetime | None]:
+    """UTC start of each analytics_cache period (weeks start on Monday)."""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "today": today,
+        "week": today - timedelta(days=today.weekday()),
+        "month": today.replace(day=1),
+        "year": today.replace(month=1, day=1),
+        "all": None,
+    }
+
+
+def empty_state(period_start: datetime | None) -> dict:
+    """Running aggregates for a period with no trades folded in yet."""
+    return {
+        "period_start": period_start.isoformat() if period_start else None,
+        "total_trades": 0, "winning_trades": 0, "losing_trades": 0,
+        "gross_win": 0.0, "gross_loss": 0.0, "largest_win": 0.0, "largest_loss": 0.0,
+        "equity": 0.0, "peak_equity": 0.0, "max_drawdown": 0.0, "max_drawdown_pct": 0.0,
+        "current_win_streak": 0, "current_loss_streak": 0, "max_win_streak": 0, "max_loss_streak": 0,
+        "duration_total": 0.0, "duration_count": 0,
+        "symbol_pnl": {}, "session_pnl": {},
+        "last_exit_timestamp": None, "last_ticket": None,
+        "needs_rebuild": False,
+    }
+
+
+def _fold_streak(flags: np.ndarray, current: int, best: int) -> tuple[int, int]:
+    """Carry a (current, longest) run of True values across a new batch."""
+    if not flags.any():
+        return 0, best
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], flags.astype(np.int8), [0]))))
+    runs = edges[1::2] - edges[::2]
+    if flags[0]:
+        runs[0] += current
+    current = int(runs[-1]) if flags[-1] else 0
+    return current, max(best, int(runs.max()))
+
+
+def _fold_groups(totals: dict, names: np.ndarray, codes: np.ndarray, pnl: np.ndarray):
+    """Add per-group P&L from a batch into a {name: pnl} accumulator."""
+    sums = np.bincount(codes, weights=pnl, minlength=len(names))
+    for code in np.unique(codes):
+        name = str(names[code])
+        totals[name] = totals.get(name, 0.0) + float(sums[code])
+
+
+def fold(state: dict, batch: dict) -> dict:
+    """Fold a batch of closed trades (sorted by exit time) into a period's state."""
+    pnl = batch["pnl"]
+    if len(pnl) == 0:
+        return state
+
+    wins = pnl > 0
+    losses = pnl < 0
+    state["total_trades"] += len(pnl)
+    state["winning_trades"] += int(wins.sum())
+    state["losing_trades"] += int(losses.sum())
+    state["gross_win"] += float(pnl[wins].sum())
+    state["gross_loss"] += float(-pnl[losses].sum())
+    state["largest_win"] = max(state["largest_win"], float(pnl.max()))
+    state["largest_loss"] = min(state["largest_loss"], float(pnl.min()))
+
+    # Drawdown against the running peak of cumulative P&L (peak starts at 0)
+    equity = state["equity"] + np.cumsum(pnl)
+    peak = np.maximum(np.maximum.accumulate(equity), state["peak_equity"])
+    drawdown = peak - equity
+    i = int(drawdown.argmax())
+    if drawdown[i] > state["max_drawdown"]:
+        state["max_drawdown"] = float(drawdown[i])
+        state["max_drawdown_pct"] = float(drawdown[i] / peak[i] * 100) if peak[i] > 0 else 0.0
+    state["equity"] = float(equity[-1])
+    state["peak_equity"] = float(peak[-1])
+
+    state["current_win_streak"], state["max_win_streak"] = _fold_streak(
+        wins, state["current_win_streak"], state["max_win_streak"])
+    state["current_loss_streak"], state["max_loss_streak"] = _fold_streak(
+        losses, state["current_loss_streak"], state["max_loss_streak"])
+
+    duration = batch["duration_s"][~np.isnan(batch["duration_s"])]
+    state["duration_total"] += float(duration.sum())
+    state["duration_count"] += len(duration)
+
+    _fold_groups(state["symbol_pnl"], batch["symbols"], batch["symbol_codes"], pnl)
+    _fold_groups(state["session_pnl"], batch["sessions"], batch["session_codes"], pnl)
+
+    state["last_exit_timestamp"] = batch["exit_iso"][-1]
+    state["last_ticket"] = batch["tickets"][-1]
+    return state
+
+
+def metrics(state: dict) -> dict:
+    """analytics_cache columns derived from a period's state."""
+    n = state["total_trades"]
+    n_wins = state["winning_trades"]
+    n_losses = state["losing_trades"]
+    gross_win = state["gross_win"]
+    gross_loss = state["gross_loss"]
+
+    if gross_loss > 0:
+        profit_factor = round(gross_win / gross_loss, 2)
+    else:
+        # No losses: unbounded, capped to fit DECIMAL(10,2)
+        profit_factor = 99999999.99 if gross_win > 0 else 0
+
+    symbol_pnl = state["symbol_pnl"]
+    session_pnl = state["session_pnl"]
+    count = state["duration_count"]
+    return {
+        "total_trades": n,
+        "winning_trades": n_wins,
+        "losing_trades": n_losses,
+        "breakeven_trades": n - n_wins - n_losses,
+        "win_rate": round(n_wins / n * 100, 2) if n else 0,
+        "profit_factor": profit_factor,
+        "avg_win": round(gross_win / n_wins, 2) if n_wins else 0,
+        "avg_loss": round(gross_loss / n_losses, 2) if n_losses else 0,
+        "largest_win": round(state["largest_win"], 2) if n_wins else 0,
+        "largest_loss": round(state["largest_loss"], 2) if n_losses else 0,
+        "total_pnl": round(state["equity"], 2),
+        "max_drawdown": round(state["max_drawdown"], 2),
+        "max_drawdown_pct": round(min(state["max_drawdown_pct"], 999.99), 2),
+        "avg_trade_duration": f"{state['duration_total'] / count:.0f} seconds" if count else None,
+        "best_symbol": max(symbol_pnl, key=symbol_pnl.get) if symbol_pnl else None,
+        "worst_symbol": min(symbol_pnl, key=symbol_pnl.get) if symbol_pnl else None,
+        "best_session": max(session_pnl, key=session_pnl.get) if session_pnl else None,
+        "worst_session": min(session_pnl, key=session_pnl.get) if session_pnl else None,
+        "consecutive_wins": state["max_win_streak"],
+        "consecutive_losses": state["max_loss_streak"],
+    }
+
+
+def _epoch(value: str) -> float:
+    """Epoch seconds for a PostgREST timestamp."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _utc_epoch(value: datetime) -> float:
+    """Epoch seconds for a naive UTC datetime."""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _columns(trades: list[dict]) -> dict:
+    """Columnar arrays for closed trades sorted by exit time."""
+    exit_ts = np.array([_epoch(t["exit_timestamp"]) for t in trades], dtype=np.float64)
+    entry_ts = np.array([_epoch(t["entry_timestamp"]) for t in trades], dtype=np.float64)
+    symbols, symbol_codes = np.unique(np.array([t["symbol"] for t in trades], dtype=object), return_inverse=True)
+    sessions, session_codes = np.unique(
+        np.array([t["session_tag"] or "unknown" for t in trades], dtype=object), return_inverse=True
+    )
+    return {
+        "pnl": np.array([float(t["pnl"]) for t in trades], dtype=np.float64),
+        "exit_ts": exit_ts,
+        "duration_s": exit_ts - entry_ts,
+        "symbols": symbols,
+        "symbol_codes": symbol_codes,
+        "sessions": sessions,
+        "session_codes": session_codes,
+        "exit_iso": np.array([t["exit_timestamp"] for t in trades], dtype=object),
+        "tickets": np.array([t["ticket_number"] for t in trades], dtype=object),
+    }
+
+
+def _select(cols: dict, mask: np.ndarray) -> dict:
+    """Row subset of a columnar batch (group name tables are shared)."""
+    return {k: v if k in ("symbols", "sessions") else v[mask] for k, v in cols.items()}
+
+
+async def _fetch_closed_trades(account_id: str, since: float | None) -> list[dict]:
+    """Closed trades for an account exiting at or after `since` (epoch), only the columns analytics needs."""
+    params = {
+        "account_id": f"eq.{account_id}",
+        "status": "eq.closed",
+        "pnl": "not.is.null",
+        "exit_timestamp": "not.is.null",
+        "select": "ticket_number,pnl,entry_timestamp,exit_timestamp,symbol,session_tag",
+        "order": "exit_timestamp.asc,ticket_number.asc",
+        "limit": str(PAGE_SIZE),
+    }
+    if since is not None:
+        params["exit_timestamp"] = f"gte.{datetime.fromtimestamp(since, timezone.utc).isoformat()}"
+    trades = []
+    offset = 0
+    while True:
+        page = await db.fetch("trades", {**params, "offset": str(offset)})
+        trades.extend(page)
+        if len(page) < PAGE_SIZE:
+            return trades
+        offset += PAGE_SIZE
+
+
+async def refresh_analytics(user_id: str, account_id: str):
+    """Fold newly closed trades into an account's running state and update analytics_cache."""
+    now = datetime.utcnow()
+    starts = {p: _utc_epoch(s) if s else None for p, s in period_starts(now).items()}
+    states = {s["period"]: s for s in await db.fetch("analytics_state", {"account_id": f"eq.{account_id}"})}
+
+    # Rebuild periods that are missing, flagged by the triggers, or whose window rolled over
+    rebuild = {
+        p for p, start in starts.items()
+        if p not in states or states[p]["needs_rebuild"]
+        or (_epoch(states[p]["period_start"]) if states[p]["period_start"] else None) != start
+    }
+
+    # One fetch covers every period: from the earliest rebuild start or fold watermark
+    bounds = []
+    for p, start in starts.items():
+        last_exit = states[p]["last_exit_timestamp"] if p not in rebuild else None
+        bounds.append(_epoch(last_exit) if last_exit else start)
+    since = None if None in bounds else min(bounds)
+    trades = await _fetch_closed_trades(account_id, since)
+    if not trades and not rebuild:
+        return
+
+    cols = _columns(trades)
+    state_rows = []
+    cache_rows = []
+    for p, start in starts.items():
+        if p in rebuild:
+            state = empty_state(period_starts(now)[p])
+            mask = cols["exit_ts"] >= (start or -np.inf)
+        else:
+            state = states[p]
+            if state["last_exit_timestamp"]:
+                # Strictly after the (exit_timestamp, ticket_number) watermark
+                wm = _epoch(state["last_exit_timestamp"])
+                mask = (cols["exit_ts"] > wm) | ((cols["exit_ts"] == wm) & (cols["tickets"] > state["last_ticket"]))
+            else:
+                mask = cols["exit_ts"] >= (start or -np.inf)
+            if not mask.any():
+                continue
+
+        state = fold(state, _select(cols, mask))
+        state.update({
+            "user_id": user_id,
+            "account_id": account_id,
+            "period": p,
+            "needs_rebuild": False,
+            "updated_at": now.isoformat(),
+        })
+        state_rows.append(state)
+        cache_rows.append({
+            "user_id": user_id,
+            "account_id": account_id,
+            "period": p,
+            **metrics(state),
+            "calculated_at": now.isoformat(),
+        })
+
+    if state_rows:
+        await db.upsert("analytics_state", state_rows, on_conflict="account_id,period")
+        await db.upsert("analytics_cache", cache_rows, on_conflict="user_id,account_id,period")
+        logger.info(f"Analytics for account {account_id}: {len(trades)} trades read, rebuilt {sorted(rebuild) or 'none'}")
@@ -0,0 +1,184 @@
+"""
+Microbenchmark: CPU and allocations per 10k rows, dict rows + json vs slotted records.
+
+Builds the same synthetic positions, deals and candles both ways and
+serializes them to the request body, plus the sync job payload round trip
+(JSON vs msgpack). "Before" reproduces the dict-per-row code the workers used
+before models.py records. Run from sync-engine/: python bench_records.py
+"""
+import json
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from models import CandleRow, PositionRow, SyncJob, dumps
+from utils import deals_to_trades, get_session_tag
+
+N = 10_000
+REPEAT = 5
+T0 = 1_700_000_000
+
+Position = namedtuple("Position", "ticket symbol type time price_open price_current volume profit sl tp swap")
+Deal = namedtuple("Deal", "time position_id symbol type entry price volume profit commission swap")
+
+POSITIONS = [
+    Position(100000 + i, "EURUSD", i % 2, T0 + i * 60, 1.1 + i * 1e-6, 1.1002, 0.1, 12.5, 1.09 if i % 3 else 0.0, 0.0, -0.3)
+    for i in range(N)
+]
+DEALS = [
+    Deal(T0 + (i // 2) * 120 + (i % 2) * 60, 200000 + i // 2, "GBPUSD", (i % 2) ^ ((i // 2) % 2), i % 2,
+         1.25 + i * 1e-6, 0.2, 0.0 if i % 2 == 0 else 8.4, -0.7, 0.0)
+    for i in range(2 * N)
+]
+RATES = np.array(
+    [(T0 + i * 1800, 1.1, 1.2, 1.0, 1.15, 100 + i, 0, 0) for i in range(N)],
+    dtype=[("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+           ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8")],
+)
+JOB = {
+    "user_id": "0b7f7f3e-6a0e-4f37-9a55-2a6f1f7d7c11",
+    "account_id": "5d0c4b1a-3f3e-4a43-8c3e-9d1b8d0a2f22",
+    "mt5_server": "ICMarketsSC-Demo",
+    "mt5_login": "51234567",
+    "password_encrypted": "gAAAAABl" + "x" * 120,
+    "job_type": "lightweight",
+    "last_sync_at": "2026-10-19T08:00:00",
+}
+
+
+# --- Before: dict rows, serialized by json (what httpx does with json=) ---
+
+def positions_before():
+    rows = []
+    for p in POSITIONS:
+        rows.append({
+            "user_id": JOB["user_id"],
+            "account_id": JOB["account_id"],
+            "ticket_number": str(p.ticket),
+            "symbol": p.symbol,
+            "direction": "buy" if p.type == 0 else "sell",
+            "entry_timestamp": datetime.utcfromtimestamp(p.time).isoformat(),
+            "entry_price": float(p.price_open),
+            "current_price": float(p.price_current),
+            "position_size": float(p.volume),
+            "floating_pnl": float(p.profit),
+            "stop_loss": float(p.sl) if p.sl else None,
+            "take_profit": float(p.tp) if p.tp else None,
+            "swap": float(p.swap),
+            "synced_at": datetime.utcnow().isoformat(),
+        })
+    return json.dumps(rows).encode()
+
+
+def deals_before():
+    rows = []
+    for d in DEALS:
+        entry_time = datetime.utcfromtimestamp(d.time)
+        rows.append({
+            "user_id": JOB["user_id"],
+            "account_id": JOB["account_id"],
+            "ticket_number": str(d.position_id),
+            "symbol": d.symbol,
+            "direction": "buy" if d.type == 0 else "sell",
+            "entry_timestamp": entry_time.isoformat(),
+            "exit_timestamp": datetime.utcfromtimestamp(d.time).isoformat() if d.entry == 1 else None,
+            "entry_price": float(d.price),
+            "exit_price": float(d.price) if d.entry == 1 else None,
+            "position_size": float(d.volume),
+            "pnl": float(d.profit) if d.entry == 1 else None,
+            "commission": float(d.commission),
+            "swap": float(d.swap),
+            "status": "closed" if d.entry == 1 else "open",
+            "import_source": "mt5",
+            "session_tag": get_session_tag(entry_time),
+        })
+    return json.dumps(rows).encode()
+
+
+def candles_before():
+    rows = []
+    for r in RATES:
+        rows.append({
+            "symbol": "EURUSD",
+            "timeframe": "M30",
+            "timestamp": datetime.utcfromtimestamp(r["time"]).isoformat(),
+            "open": float(r["open"]),
+            "high": float(r["high"]),
+            "low": float(r["low"]),
+            "close": float(r["close"]),
+            "volume": float(r["tick_volume"]),
+        })
+    return json.dumps(rows).encode()
+
+
+def jobs_before():
+    for _ in range(N):
+        json.loads(json.dumps(JOB))
+
+
+# --- After: slotted records serialized by to_json ---
+
+def positions_after():
+    synced_at = datetime.utcnow().isoformat()
+    return dumps([
+        PositionRow(
+            JOB["user_id"], JOB["account_id"], str(p.ticket), p.symbol, "buy" if p.type == 0 else "sell",
+            datetime.utcfromtimestamp(p.time).isoformat(), float(p.price_open), float(p.price_current),
+            float(p.volume), float(p.profit), float(p.sl) if p.sl else None, float(p.tp) if p.tp else None,
+            float(p.swap), synced_at,
+        )
+        for p in POSITIONS
+    ])
+
+
+def deals_after():
+    return dumps(deals_to_trades(JOB["user_id"], JOB["account_id"], DEALS))
+
+
+def candles_after():
+    return dumps(CandleRow.from_rates("EURUSD", "M30", RATES))
+
+
+def jobs_after():
+    job = SyncJob(**JOB)
+    for _ in range(N):
+        SyncJob.unpack(job.pack())
+
+
+def measure(fn) -> tuple[float, float]:
+    """(CPU ms, peak traced allocations in KiB) for one 10k-row run."""
+    fn()  # warm up
+    start = time.process_time()
+    for _ in range(REPEAT):
+        fn()
+    cpu_ms = (time.process_time() - start) / REPEAT * 1000
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu_ms, peak / 1024
+
+
+def main():
+    cases = [
+        ("positions", positions_before, positions_after),
+        ("deals -> trades", deals_before, deals_after),
+        ("candles", candles_before, candles_after),
+        ("job payload", jobs_before, jobs_after),
+    ]
+    print(f"{'per 10k rows':<18}{'CPU ms':>18}{'peak KiB':>22}")
+    print(f"{'':<18}{'before':>9}{'after':>9}{'before':>11}{'after':>11}")
+    for name, before, after in cases:
+        b_cpu, b_peak = measure(before)
+        a_cpu, a_peak = measure(after)
+        print(f"{name:<18}{b_cpu:>9.1f}{a_cpu:>9.1f}{b_peak:>11.0f}{a_peak:>11.0f}")
+    job = SyncJob(**JOB)
+    print(f"job payload bytes: json {len(json.dumps(JOB))}, msgpack {len(job.pack())}")
+
+
+if __name__ == "__main__":
+    main()
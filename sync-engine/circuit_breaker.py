@@ -0,0 +1,137 @@
+"""
+Broker circuit breaker — per-mt5_server login health shared by all workers via Redis.
+
+Login outcomes are recorded per server in short time buckets as sets of
+account ids, so the failure rate is "accounts that failed / accounts that
+tried" over the window and one account with a bad password cannot trip it.
+When the rate crosses BREAKER_FAILURE_RATE the breaker opens: workers push
+that server's jobs back on their lane to the retry time (plus jitter)
+without spending a terminal login on them. After the cooldown, the first
+worker to take the probe lock logs in as a half-open probe; success closes
+the breaker, failure re-opens it with a doubled cooldown.
+
+Keys:
+  breaker:{server}             hash  state (open/half_open), retry_at, cooldown, opened_at
+  breaker_probe:{server}       str   half-open probe lock (SET NX EX)
+  breaker_tried:{server}:{n}   set   account ids that logged in during bucket n
+  breaker_failed:{server}:{n}  set   account ids whose login failed during bucket n
+"""
+import logging
+import random
+import time
+
+import redis.asyncio as aioredis
+
+import config
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 15
+
+
+def jittered(at: float, spread: float) -> float:
+    """A queue score at `at` plus up to `spread` * BREAKER_JITTER seconds, so deferred jobs don't stampede."""
+    return at + random.uniform(0, spread * config.BREAKER_JITTER)
+
+
+def _buckets(now: float) -> range:
+    last = int(now // BUCKET_SECONDS)
+    return range(last - config.BREAKER_WINDOW_SECONDS // BUCKET_SECONDS, last + 1)
+
+
+def _bucket_keys(server: str, now: float) -> list[str]:
+    return [f"breaker_{kind}:{server}:{b}" for kind in ("tried", "failed") for b in _buckets(now)]
+
+
+async def admit(redis_pool: aioredis.Redis, server: str) -> tuple[float | None, bool]:
+    """Whether a login to `server` may go ahead, as (defer_until, probe).
+
+    defer_until is the queue score to push the job back to, or None if the
+    login may proceed. probe is True when this login is the half-open probe
+    and its outcome must be recorded with probe=True.
+    """
+    breaker = await redis_pool.hgetall(f"breaker:{server}")
+    if not breaker:
+        return None, False
+
+    now = time.time()
+    cooldown = float(breaker["cooldown"])
+    retry_at = float(breaker["retry_at"])
+    if now < retry_at:
+        return jittered(retry_at, cooldown), False
+
+    # Cooldown over: one worker probes, everyone else waits for its verdict
+    if await redis_pool.set(f"breaker_probe:{server}", "1", nx=True, ex=config.BREAKER_PROBE_TIMEOUT):
+        await redis_pool.hset(f"breaker:{server}", "state", "half_open")
+        logger.info(f"Breaker for {server} half-open, probing")
+        return None, True
+    return jittered(now + config.BREAKER_PROBE_TIMEOUT, cooldown), False
+
+
+async def record(
+    redis_pool: aioredis.Redis, server: str, account_id: str, ok: bool, probe: bool = False
+) -> float | None:
+    """Record a login outcome.
+
+    Returns the queue score to defer the job to if the server's breaker is
+    open afterwards (the failure was the broker's, not the account's), else None.
+    """
+    now = time.time()
+    bucket = int(now // BUCKET_SECONDS)
+    ttl = config.BREAKER_WINDOW_SECONDS + BUCKET_SECONDS
+
+    pipe = redis_pool.pipeline(transaction=False)
+    pipe.sadd(f"breaker_tried:{server}:{bucket}", account_id)
+    pipe.expire(f"breaker_tried:{server}:{bucket}", ttl)
+    if not ok:
+        pipe.sadd(f"breaker_failed:{server}:{bucket}", account_id)
+        pipe.expire(f"breaker_failed:{server}:{bucket}", ttl)
+    await pipe.execute()
+
+    if probe:
+        await redis_pool.delete(f"breaker_probe:{server}")
+        if ok:
+            # Drop the outage's buckets too, or they'd still count toward the rate after closing
+            await redis_pool.delete(f"breaker:{server}", *_bucket_keys(server, now))
+            logger.info(f"Breaker for {server} closed")
+            return None
+        cooldown = float(await redis_pool.hget(f"breaker:{server}", "cooldown") or config.BREAKER_COOLDOWN)
+        return await _open(redis_pool, server, min(cooldown * 2, config.BREAKER_MAX_COOLDOWN), now)
+
+    if ok:
+        return None
+    breaker = await redis_pool.hgetall(f"breaker:{server}")
+    if breaker:
+        return jittered(max(float(breaker["retry_at"]), now), float(breaker["cooldown"]))
+
+    # Failure rate over the window, by distinct account
+    pipe = redis_pool.pipeline(transaction=False)
+    pipe.sunion([f"breaker_tried:{server}:{b}" for b in _buckets(now)])
+    pipe.sunion([f"breaker_failed:{server}:{b}" for b in _buckets(now)])
+    tried, failed = await pipe.execute()
+    if len(tried) < config.BREAKER_MIN_ACCOUNTS or len(failed) / len(tried) < config.BREAKER_FAILURE_RATE:
+        return None
+
+    logger.warning(f"Breaker for {server} opened: {len(failed)}/{len(tried)} accounts failed to log in")
+    return await _open(redis_pool, server, config.BREAKER_COOLDOWN, now)
+
+
+async def _open(redis_pool: aioredis.Redis, server: str, cooldown: float, now: float) -> float:
+    """Open (or re-open) a server's breaker; returns a jittered queue score past the retry time."""
+    retry_at = jittered(now + cooldown, cooldown)
+    await redis_pool.hset(f"breaker:{server}", mapping={
+        "state": "open",
+        "cooldown": str(cooldown),
+        "retry_at": str(retry_at),
+        "opened_at": str(now),
+    })
+    await redis_pool.expire(f"breaker:{server}", int(config.BREAKER_MAX_COOLDOWN * 4))
+    return jittered(retry_at, cooldown)
+
+
+async def status(redis_pool: aioredis.Redis) -> dict:
+    """Breakers that are currently open or half-open, for /admin/status."""
+    breakers = {}
+    async for key in redis_pool.scan_iter(match="breaker:*"):
+        breakers[key.split(":", 1)[1]] = await redis_pool.hgetall(key)
+    return breakers
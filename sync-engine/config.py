@@ -16,6 +16,13 @@ ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "")  # 32-byte hex
 # MT5 terminal paths (inside container)
 MT5_TERMINAL_PATH = "/opt/mt5/worker_{worker_id}/drive_c/Program Files/MetaTrader 5/terminal64.exe"
 
+# Terminal recycling triggers: resident memory ceiling and call-latency drift vs. post-start baseline
+TERMINAL_MAX_RSS_MB = int(os.getenv("TERMINAL_MAX_RSS_MB", "1500"))
+TERMINAL_LATENCY_DRIFT = float(os.getenv("TERMINAL_LATENCY_DRIFT", "3.0"))
+# Wait after a failed recycle before trying again (doubles per failure, capped)
+TERMINAL_RECYCLE_COOLDOWN = int(os.getenv("TERMINAL_RECYCLE_COOLDOWN", "60"))
+TERMINAL_RECYCLE_MAX_COOLDOWN = int(os.getenv("TERMINAL_RECYCLE_MAX_COOLDOWN", "1800"))
+
 # Demo account for market data worker (#4)
 DEMO_MT5_LOGIN = os.getenv("DEMO_MT5_LOGIN", "")
 DEMO_MT5_PASSWORD = os.getenv("DEMO_MT5_PASSWORD", "")
@@ -26,8 +33,39 @@ SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", "15"))
 FULL_CHECK_INTERVAL = int(os.getenv("FULL_CHECK_INTERVAL", "60"))
 CANDLE_UPDATE_INTERVAL = int(os.getenv("CANDLE_UPDATE_INTERVAL", "30"))
 GRACE_PERIOD = int(os.getenv("GRACE_PERIOD", "300"))
-TERMINAL_RESTART_HOURS = int(os.getenv("TERMINAL_RESTART_HOURS", "5"))
+HOT_SYMBOL_FLUSH_INTERVAL = int(os.getenv("HOT_SYMBOL_FLUSH_INTERVAL", "300"))
+CANDLE_GAP_SCAN_INTERVAL = int(os.getenv("CANDLE_GAP_SCAN_INTERVAL", "300"))
+# Gaps closer than this many bars are backfilled with one copy_rates_range call
+CANDLE_GAP_MERGE_BARS = int(os.getenv("CANDLE_GAP_MERGE_BARS", "48"))
+CANDLE_MAINTENANCE_INTERVAL = int(os.getenv("CANDLE_MAINTENANCE_INTERVAL", "86400"))
+
+# Hot symbols drop out of the Redis set after this long without a position/chart
+HOT_SYMBOL_TTL_DAYS = 7
+
+# Sync job lanes and their weighted-fair dequeue share
+SYNC_LANE_WEIGHTS = {"lightweight": 6, "catchup": 1}
+CATCHUP_WINDOW_DAYS = int(os.getenv("CATCHUP_WINDOW_DAYS", "90"))
+
+# Per-broker-server login circuit breaker (see circuit_breaker.py)
+BREAKER_WINDOW_SECONDS = int(os.getenv("BREAKER_WINDOW_SECONDS", "120"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_ACCOUNTS = int(os.getenv("BREAKER_MIN_ACCOUNTS", "3"))
+BREAKER_COOLDOWN = int(os.getenv("BREAKER_COOLDOWN", "30"))
+BREAKER_MAX_COOLDOWN = int(os.getenv("BREAKER_MAX_COOLDOWN", "600"))
+BREAKER_PROBE_TIMEOUT = 30
+BREAKER_JITTER = 0.2  # fraction of the cooldown spread over deferred queue scores
+
+# Per-symbol trading-session calendars (see sessions.py)
+SESSION_LOOKBACK_DAYS = int(os.getenv("SESSION_LOOKBACK_DAYS", "21"))
+SESSION_REFRESH_INTERVAL = int(os.getenv("SESSION_REFRESH_INTERVAL", "86400"))
+# Accounts whose markets are all closed still get a lightweight sync this often
+SESSION_CLOSED_SYNC_INTERVAL = int(os.getenv("SESSION_CLOSED_SYNC_INTERVAL", "1800"))
+ACCOUNT_SYMBOL_TTL_DAYS = 30
 
 # Candle timeframes
 CANDLE_TIMEFRAMES = ["M30", "H1", "H4", "D1", "W1"]
 CANDLE_HISTORY_MONTHS = 6
+
+# Trade history import
+FREE_TIER_TRADE_LIMIT = 15  # trades/month, same as the web app
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
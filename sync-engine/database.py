@@ -1,5 +1,6 @@
 import httpx
 from config import SUPABASE_URL, SUPABASE_SERVICE_KEY
+from models import dumps
 
 _headers = {
     "apikey": SUPABASE_SERVICE_KEY,
@@ -11,6 +12,13 @@ _headers = {
 _client = httpx.AsyncClient(base_url=f"{SUPABASE_URL}/rest/v1", headers=_headers, timeout=30.0)
 
 
+def _body(data) -> dict:
+    """Request body kwargs: record lists (models.py) are already in wire format, the rest goes through json."""
+    if isinstance(data, list) and data and hasattr(data[0], "to_json"):
+        return {"content": dumps(data)}
+    return {"json": data}
+
+
 async def fetch(table: str, params: dict | None = None) -> list[dict]:
     """GET rows from a table."""
     resp = await _client.get(f"/{table}", params=params or {})
@@ -18,20 +26,23 @@ async def fetch(table: str, params: dict | None = None) -> list[dict]:
     return resp.json()
 
 
-async def insert(table: str, data: dict | list[dict]) -> list[dict]:
+async def insert(table: str, data: dict | list) -> list[dict]:
     """INSERT row(s)."""
-    resp = await _client.post(f"/{table}", json=data)
+    resp = await _client.post(f"/{table}", **_body(data))
     resp.raise_for_status()
     return resp.json()
 
 
-async def upsert(table: str, data: dict | list[dict], on_conflict: str = "") -> list[dict]:
-    """UPSERT row(s) with ON CONFLICT merge."""
-    headers = {**_headers, "Prefer": "return=representation,resolution=merge-duplicates"}
+async def upsert(
+    table: str, data: dict | list, on_conflict: str = "", ignore_duplicates: bool = False
+) -> list[dict]:
+    """UPSERT row(s) with ON CONFLICT merge, or ON CONFLICT DO NOTHING (only inserted rows come back)."""
+    resolution = "ignore-duplicates" if ignore_duplicates else "merge-duplicates"
+    headers = {**_headers, "Prefer": f"return=representation,resolution={resolution}"}
     params = {}
     if on_conflict:
         params["on_conflict"] = on_conflict
-    resp = await _client.post(f"/{table}", json=data, headers=headers, params=params)
+    resp = await _client.post(f"/{table}", **_body(data), headers=headers, params=params)
     resp.raise_for_status()
     return resp.json()
 
@@ -44,9 +55,10 @@ async def update(table: str, match: dict, data: dict) -> list[dict]:
     return resp.json()
 
 
-async def delete(table: str, match: dict) -> None:
-    """DELETE rows matching filters."""
+async def delete(table: str, match: dict, filters: dict | None = None) -> None:
+    """DELETE rows matching filters (`filters` are raw PostgREST ones, e.g. {"col": "lt.<value>"})."""
     params = {f"{k}": f"eq.{v}" for k, v in match.items()}
+    params.update(filters or {})
     resp = await _client.delete(f"/{table}", params=params)
     resp.raise_for_status()
 
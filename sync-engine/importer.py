@@ -0,0 +1,355 @@
+"""
+Trade history importer — stream-parses uploaded CSV files and MT5 statements.
+
+Files are read chunk by chunk (CSV rows, HTML parser feeds, openpyxl read-only
+rows), so memory stays bounded by the batch size plus one small record per
+paired position (kept so later partial closes merge into the same trade).
+MT5 deal lists (statement "Deals" tables, or CSVs with a Direction/Entry
+column) are paired into trades with the same
+deals_to_trades() the trade worker uses. Any other CSV is mapped one row per
+trade, like the web importer's column mapping.
+"""
+import codecs
+import csv
+import hashlib
+import io
+import logging
+import math
+from collections import defaultdict, deque, namedtuple
+from datetime import datetime
+from html.parser import HTMLParser
+
+from openpyxl import load_workbook
+
+import config
+import database as db
+from models import TradeRow
+from utils import deals_to_trades, get_session_tag
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Deal shaped like an MT5 TradeDeal, for deals_to_trades()
+Deal = namedtuple("Deal", "time position_id symbol type entry price volume profit commission swap")
+
+DEAL_TYPES = {"buy": 0, "sell": 1}
+DEAL_ENTRIES = {"in": 0, "out": 1, "in/out": 1, "0": 0, "1": 1}
+TIME_FORMATS = ("%Y.%m.%d %H:%M:%S", "%Y.%m.%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y %H:%M")
+
+# Generic CSV column heuristics (same keywords as the web importer)
+GENERIC_COLUMNS = {
+    "ticket_number": ["ticket", "deal", "order", "id"],
+    "symbol": ["symbol", "pair", "instrument"],
+    "direction": ["type", "direction", "side"],
+    "entry_timestamp": ["open time", "entry time", "entry date", "open date", "time"],
+    "exit_timestamp": ["close time", "exit time", "close date", "exit date"],
+    "entry_price": ["open price", "entry price", "entry"],
+    "exit_price": ["close price", "exit price", "exit"],
+    "position_size": ["volume", "lot", "size", "quantity"],
+    "pnl": ["profit", "pnl", "p&l", "net profit"],
+    "commission": ["commission", "comm"],
+    "swap": ["swap"],
+}
+
+
+# --- Row sources (each yields lists of cell strings) ---
+
+def _encoding(file) -> str:
+    head = file.read(4)
+    file.seek(0)
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    return "utf-8-sig"
+
+
+def _csv_rows(file):
+    text = io.TextIOWrapper(file, encoding=_encoding(file), errors="replace", newline="")
+    sample = text.read(CHUNK_SIZE)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+class _TableRows(HTMLParser):
+    """Collects <tr> rows as lists of cell text while HTML is fed in chunks."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._cell is not None and self._row is not None:
+            self._row.append("".join(self._cell).strip())
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def _html_rows(file):
+    decoder = codecs.getincrementaldecoder(_encoding(file))(errors="replace")
+    parser = _TableRows()
+    while chunk := file.read(CHUNK_SIZE):
+        parser.feed(decoder.decode(chunk))
+        yield from parser.rows
+        parser.rows.clear()
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    yield from parser.rows
+
+
+def _xlsx_rows(file):
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            for row in sheet.iter_rows(values_only=True):
+                yield ["" if v is None else str(v).strip() for v in row]
+    finally:
+        workbook.close()
+
+
+# --- Normalization ---
+
+def _number(value: str | None) -> float | None:
+    if value is None:
+        return None
+    value = value.replace(" ", "").replace("\xa0", "")
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    value = value.strip()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _is_deal_header(cells: list[str]) -> bool:
+    lower = {c.lower() for c in cells}
+    return {"time", "symbol", "type"} <= lower and bool(lower & {"direction", "entry"})
+
+
+def _deals(records, positions: dict):
+    """Deal tuples from header-keyed records.
+
+    Without a position column, exits close open entries FIFO per symbol by
+    volume, so a partial close keeps the entry open for the next exit.
+    """
+    for rec in records:
+        deal_type = DEAL_TYPES.get(rec.get("type", "").lower())
+        entry = DEAL_ENTRIES.get((rec.get("direction") or rec.get("entry") or "").lower())
+        deal_time = _parse_time(rec.get("time"))
+        symbol = rec.get("symbol", "")
+        if deal_type is None or entry is None or deal_time is None or not symbol:
+            continue
+
+        # MT5 position ids are the opening order's ticket
+        volume = _number(rec.get("volume")) or 0.0
+        position = rec.get("position") or ""
+        if not position:
+            open_queue = positions[symbol]
+            if entry == 0:
+                position = rec.get("order") or rec.get("deal") or ""
+                open_queue.append([position, volume])
+            elif open_queue:
+                position = open_queue[0][0]
+                open_queue[0][1] -= volume
+                if open_queue[0][1] <= 1e-9:
+                    open_queue.popleft()
+            else:
+                position = rec.get("order") or rec.get("deal") or ""
+        if not position:
+            continue
+
+        yield Deal(
+            time=int((deal_time - datetime(1970, 1, 1)).total_seconds()),
+            position_id=position,
+            symbol=symbol,
+            type=deal_type,
+            entry=entry,
+            price=_number(rec.get("price")) or 0.0,
+            volume=volume,
+            profit=_number(rec.get("profit")) or 0.0,
+            commission=(_number(rec.get("commission")) or 0.0) + (_number(rec.get("fee")) or 0.0),
+            swap=_number(rec.get("swap")) or 0.0,
+        )
+
+
+def _suggest_mapping(headers: list[str]) -> dict:
+    mapping = {}
+    for field, keywords in GENERIC_COLUMNS.items():
+        match = next((h for h in headers if any(k in h.lower() for k in keywords)), None)
+        if match:
+            mapping[field] = match
+    return mapping
+
+
+def _generic_trade(user_id: str, account_id: str, row: dict, mapping: dict) -> TradeRow | None:
+    """One CSV row -> trade row, mirroring the web importer's mapRowToTrade()."""
+    def get(field):
+        col = mapping.get(field)
+        return (row.get(col) or "").strip() if col else ""
+
+    symbol = "".join(c for c in get("symbol").upper() if c.isalnum())
+    entry_price = _number(get("entry_price"))
+    if not symbol or not entry_price:
+        return None
+
+    raw_direction = get("direction").lower()
+    exit_price = _number(get("exit_price")) or None
+    pnl = _number(get("pnl"))
+    entry_time = _parse_time(get("entry_timestamp")) or datetime.utcnow()
+    exit_time = _parse_time(get("exit_timestamp"))
+    if exit_time is None and exit_price:
+        exit_time = datetime.utcnow()
+    ticket = get("ticket_number") or "csv-" + hashlib.sha1(repr(sorted(row.items())).encode()).hexdigest()[:16]
+    closed = exit_price is not None or pnl is not None
+
+    return TradeRow(
+        user_id=user_id,
+        account_id=account_id,
+        ticket_number=ticket,
+        symbol=symbol,
+        direction="sell" if "sell" in raw_direction or raw_direction == "1" else "buy",
+        entry_timestamp=entry_time.isoformat(),
+        exit_timestamp=exit_time.isoformat() if exit_time else None,
+        entry_price=entry_price,
+        exit_price=exit_price,
+        position_size=_number(get("position_size")) or 0.01,
+        pnl=pnl,
+        commission=_number(get("commission")) or 0.0,
+        swap=_number(get("swap")) or 0.0,
+        status="closed" if closed else "open",
+        import_source="csv",
+        session_tag=get_session_tag(entry_time),
+    )
+
+
+def _trades(user_id: str, account_id: str, rows, is_statement: bool, mapping: dict | None, pending: dict):
+    """Yield lists of trade rows as the source rows stream in."""
+    header = None
+    deal_mode = False
+    positions = defaultdict(deque)
+    closed = {}
+    batch = []
+
+    for cells in rows:
+        if not any(cells):
+            continue
+        if is_statement:
+            if _is_deal_header(cells):
+                header, deal_mode = [c.lower() for c in cells], True
+                continue
+            if header is None:
+                continue  # Statement preamble before the Deals table
+        elif header is None:
+            deal_mode = _is_deal_header(cells)
+            header = [c.lower() for c in cells] if deal_mode else cells
+            if not deal_mode:
+                mapping = mapping or _suggest_mapping(header)
+            continue
+
+        record = dict(zip(header, cells))
+        if deal_mode:
+            batch.extend(deals_to_trades(
+                user_id, account_id, _deals([record], positions), pending, import_source="csv", closed=closed,
+            ))
+        else:
+            trade = _generic_trade(user_id, account_id, record, mapping)
+            if trade:
+                batch.append(trade)
+
+        if len(batch) >= config.IMPORT_BATCH_SIZE:
+            yield _unique(batch)
+            batch = []
+
+    # Positions still open at the end of the file
+    batch.extend(pending.values())
+    pending.clear()
+    if batch:
+        yield _unique(batch)
+
+
+def _unique(batch: list[TradeRow]) -> list[TradeRow]:
+    """One row per ticket (the last), since an upsert can't touch the same row twice.
+
+    A trade closed again in a later batch is re-sent with its merged totals.
+    """
+    return list({t.ticket_number: t for t in batch}.values())
+
+
+async def import_file(
+    user_id: str,
+    account_id: str,
+    filename: str,
+    file,
+    mapping: dict | None = None,
+    limit: int | None = None,
+    on_progress=None,
+) -> dict:
+    """Stream-parse an uploaded file and upsert its trades in batches."""
+    name = filename.lower()
+    if name.endswith((".htm", ".html")):
+        rows, is_statement = _html_rows(file), True
+    elif name.endswith(".xlsx"):
+        rows, is_statement = _xlsx_rows(file), True
+    else:
+        rows, is_statement = _csv_rows(file), False
+
+    stats = {"total": 0, "imported": 0, "errors": 0, "limit_reached": False}
+    seen = set()  # tickets already sent by this import
+    inserted = set()  # of those, the ones it created; a later partial close updates them
+    for batch in _trades(user_id, account_id, rows, is_statement, mapping, {}):
+        new = [t for t in batch if t.ticket_number not in seen]
+        merged = [t for t in batch if t.ticket_number in inserted]
+        stats["total"] += len(new)
+        if limit is not None and len(new) > limit - stats["imported"]:
+            new = new[:limit - stats["imported"]]
+            stats["limit_reached"] = True
+        try:
+            if new:
+                # Like the web importer: trades already in the journal (e.g. synced from MT5) are left alone
+                written = await db.upsert(
+                    "trades", new, on_conflict="account_id,ticket_number", ignore_duplicates=True,
+                )
+                inserted.update(r["ticket_number"] for r in written)
+                stats["imported"] += len(written)
+            if merged:
+                await db.upsert("trades", merged, on_conflict="account_id,ticket_number")
+            seen.update(t.ticket_number for t in new)
+        except Exception as e:
+            logger.error(f"Import batch failed for account {account_id}: {e}")
+            stats["errors"] += len(new)
+        if on_progress:
+            await on_progress(dict(stats))
+        if stats["limit_reached"]:
+            break
+    return stats
@@ -2,26 +2,33 @@
 RawJournal Market Data Worker — Pulls candle data from MT5 demo account.
 
 Worker #4: stays logged into a free demo account permanently.
-Fetches candle data for "hot symbols" (symbols with active user positions)
-and caches them in PostgreSQL + Redis.
+Fetches candle data for "hot symbols" (symbols with active user positions
+or open charts) and caches them in PostgreSQL + Redis. Hot-symbol liveness
+lives in the Redis sorted set `hot_symbols` (scored by last-seen time);
+Postgres only receives a periodic snapshot. Symbols whose trading session
+is closed (see sessions.py) are not polled; the loop wakes at the next open.
 """
 import asyncio
 import json
 import logging
 import os
 import time
-from glob import glob
 from datetime import datetime, timedelta
 
 import redis.asyncio as aioredis
 
 import config
-from mt5_bridge import mt5, TIMEFRAME_M30, TIMEFRAME_H1, TIMEFRAME_H4, TIMEFRAME_D1, TIMEFRAME_W1
+from mt5_bridge import TerminalPool, TIMEFRAME_M30, TIMEFRAME_H1, TIMEFRAME_H4, TIMEFRAME_D1, TIMEFRAME_W1
 import database as db
+import sessions
+from models import CandleRow
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [market-data] %(message)s")
 logger = logging.getLogger("market-data")
 
+worker_id = int(os.getenv("WORKER_ID", "4"))
+mt5 = TerminalPool(worker_id)
+
 # MT5 timeframe mapping (constants from mt5_bridge, no remote lookup needed)
 TF_MAP = {
     "M30": TIMEFRAME_M30,
@@ -31,74 +38,110 @@ TF_MAP = {
     "W1": TIMEFRAME_W1,
 }
 
+# Bar cadence per timeframe, used by the gap scanner
+TF_SECONDS = {
+    "M30": 1800,
+    "H1": 3600,
+    "H4": 14400,
+    "D1": 86400,
+    "W1": 604800,
+}
+
 
 async def main():
     redis_pool = aioredis.from_url(config.REDIS_URL, decode_responses=True)
-    worker_id = int(os.getenv("WORKER_ID", "4"))
-    terminal_path = config.MT5_TERMINAL_PATH.format(worker_id=worker_id)
-
-    logger.info(f"Initializing MT5 terminal at {terminal_path}")
 
-    # Try configured path first
-    if not mt5.initialize(path=terminal_path):
-        logger.warning(f"MT5 init with configured path failed: {mt5.last_error()}")
-
-        # Try any terminal64.exe found in worker prefix
-        candidates = glob(f"/opt/mt5/worker_{worker_id}/**/terminal64.exe", recursive=True)
-        for candidate in candidates:
-            logger.info(f"Trying alternate MT5 path: {candidate}")
-            if mt5.initialize(path=candidate):
-                terminal_path = candidate
-                break
-        else:
-            # Final fallback: let MT5 library use default path if available
-            logger.info("Trying MT5 initialize() without path as fallback")
-            if not mt5.initialize():
-                logger.error(f"MT5 init failed: {mt5.last_error()}")
-                return
+    logger.info("Initializing MT5 terminal")
+    if not mt5.initialize():
+        logger.error(f"MT5 init failed: {mt5.last_error()}")
+        return
 
     # Login to demo account (stays logged in)
-    ok = mt5.login(
-        int(config.DEMO_MT5_LOGIN),
-        password=config.DEMO_MT5_PASSWORD,
-        server=config.DEMO_MT5_SERVER,
-        timeout=10000,
-    )
-    if not ok:
+    if not _demo_login(mt5):
         logger.error(f"Demo login failed: {mt5.last_error()}")
         return
 
     logger.info("Logged into demo account for market data")
     start_time = time.time()
+    last_flush = time.time()
+    last_gap_scan = 0.0
+    last_maintenance = 0.0
+    last_calendar_refresh = 0.0
+    last_fetch: dict[str, float] = {}  # symbol -> time of its last candle poll
+
+    # Seed the Redis hot set from the last Postgres snapshot (e.g. after a Redis flush)
+    if not await redis_pool.zcard("hot_symbols"):
+        snapshot = await db.fetch("hot_symbols", {"select": "symbol,last_active"})
+        if snapshot:
+            await redis_pool.zadd("hot_symbols", {
+                s["symbol"]: datetime.fromisoformat(s["last_active"].replace("Z", "+00:00")).timestamp()
+                for s in snapshot
+            })
 
     while True:
         # Health report
+        terminal_alive = mt5.probe()
         uptime = (time.time() - start_time) / 3600
         await redis_pool.hset("worker:4:health", mapping={
             "status": "running",
-            "terminal_alive": str(mt5.terminal_info() is not None),
+            "terminal_alive": str(terminal_alive),
             "current_server": config.DEMO_MT5_SERVER,
             "uptime_hours": f"{uptime:.1f}",
+            "terminal_rss_mb": f"{mt5.rss_mb:.0f}",
+            "call_latency_ms": f"{mt5.latency_ms:.1f}",
         })
 
-        # Terminal restart
-        if uptime > config.TERMINAL_RESTART_HOURS:
-            logger.info("Restarting terminal")
-            mt5.shutdown()
-            await asyncio.sleep(2)
-            mt5.initialize(path=terminal_path)
-            mt5.login(int(config.DEMO_MT5_LOGIN), password=config.DEMO_MT5_PASSWORD, server=config.DEMO_MT5_SERVER)
+        # Recycle onto a standby terminal that is already logged into the demo account
+        if mt5.recycle(warm_up=_demo_login):
             start_time = time.time()
 
         # Get hot symbols
-        hot_symbols = await db.fetch("hot_symbols", {"select": "symbol"})
-        symbols = [s["symbol"] for s in hot_symbols]
+        symbols = await _get_hot_symbols(redis_pool)
+
+        # Periodic batched snapshot to Postgres
+        if time.time() - last_flush > config.HOT_SYMBOL_FLUSH_INTERVAL:
+            try:
+                await _flush_hot_symbols(redis_pool)
+            except Exception as e:
+                logger.error(f"Hot symbol flush failed: {e}")
+            last_flush = time.time()
 
         if not symbols:
             await asyncio.sleep(config.CANDLE_UPDATE_INTERVAL)
             continue
 
+        # Session calendars for hot symbols and symbols trade workers have seen on accounts:
+        # build new ones as they appear, rebuild all daily
+        wanted = set(symbols) | set(await redis_pool.zrangebyscore(
+            "session_symbols", time.time() - config.ACCOUNT_SYMBOL_TTL_DAYS * 86400, "+inf"
+        ))
+        calendars = await sessions.load(redis_pool, wanted)
+        if time.time() - last_calendar_refresh > config.SESSION_REFRESH_INTERVAL:
+            stale, last_calendar_refresh = wanted, time.time()
+        else:
+            stale = wanted - calendars.keys()
+        if stale:
+            try:
+                calendars.update(await sessions.refresh(redis_pool, mt5, stale))
+            except Exception as e:
+                logger.error(f"Session calendar refresh failed: {e}")
+
+        now = time.time()
+        next_open = None
         for symbol in symbols:
+            calendar = calendars.get(symbol)
+            if calendar and not calendar["tradable"]:
+                continue
+
+            # Closed session: one last poll after the close picks up the final bar,
+            # then nothing until the next open
+            if not sessions.open_between(calendar, last_fetch.get(symbol, 0.0), now + 1):
+                opens = sessions.next_open(calendar, now)
+                if opens:
+                    next_open = min(next_open or opens, opens)
+                continue
+            last_fetch[symbol] = now
+
             for tf_name in config.CANDLE_TIMEFRAMES:
                 tf = TF_MAP.get(tf_name)
                 if tf is None:
@@ -123,44 +166,196 @@ async def main():
                     if rates is None or len(rates) == 0:
                         continue
 
-                    # Build rows
-                    rows = []
-                    for r in rates:
-                        rows.append({
-                            "symbol": symbol,
-                            "timeframe": tf_name,
-                            "timestamp": datetime.utcfromtimestamp(r["time"]).isoformat(),
-                            "open": float(r["open"]),
-                            "high": float(r["high"]),
-                            "low": float(r["low"]),
-                            "close": float(r["close"]),
-                            "volume": float(r["tick_volume"]),
-                        })
+                    rows = CandleRow.from_rates(symbol, tf_name, rates)
 
                     if rows:
-                        # Batch upsert (chunks of 500)
-                        for i in range(0, len(rows), 500):
-                            await db.upsert("candle_cache", rows[i:i+500], on_conflict="symbol,timeframe,timestamp")
+                        await _upsert_candles(rows)
 
                         # Cache latest candle in Redis for instant access
                         latest = rows[-1]
                         await redis_pool.hset(f"candle:{symbol}:{tf_name}", mapping={
-                            "o": str(latest["open"]),
-                            "h": str(latest["high"]),
-                            "l": str(latest["low"]),
-                            "c": str(latest["close"]),
-                            "t": latest["timestamp"],
+                            "o": str(latest.open),
+                            "h": str(latest.high),
+                            "l": str(latest.low),
+                            "c": str(latest.close),
+                            "t": latest.timestamp,
                         })
 
                 except Exception as e:
                     logger.error(f"Error fetching {symbol} {tf_name}: {e}")
 
-        # Clean up cold symbols (inactive > 7 days)
-        cutoff = (datetime.utcnow() - timedelta(days=7)).isoformat()
-        await db.delete("hot_symbols", {"last_active": f"lt.{cutoff}"})
+        # Low-priority lane: repair one symbol's gaps per scan interval
+        if time.time() - last_gap_scan > config.CANDLE_GAP_SCAN_INTERVAL:
+            try:
+                await _scan_next_symbol(symbols, calendars)
+            except Exception as e:
+                logger.error(f"Gap scan failed: {e}")
+            last_gap_scan = time.time()
+
+        # Candle retention: create upcoming partitions, drop expired ones
+        if time.time() - last_maintenance > config.CANDLE_MAINTENANCE_INTERVAL:
+            try:
+                dropped = await db.rpc("maintain_candle_partitions")
+                if dropped:
+                    logger.info(f"Dropped {dropped} expired candle partitions")
+            except Exception as e:
+                logger.error(f"Candle partition maintenance failed: {e}")
+            last_maintenance = time.time()
+
+        # Wake right at the next session open instead of up to a full interval later
+        delay = config.CANDLE_UPDATE_INTERVAL
+        if next_open:
+            delay = min(delay, max(next_open + sessions.OPEN_SETTLE_SECONDS - time.time(), 1))
+        await asyncio.sleep(delay)
+
+
+def _demo_login(client) -> bool:
+    """Log a terminal client into the market data demo account."""
+    return client.login(
+        int(config.DEMO_MT5_LOGIN),
+        password=config.DEMO_MT5_PASSWORD,
+        server=config.DEMO_MT5_SERVER,
+        timeout=10000,
+    )
+
+
+async def _upsert_candles(rows: list[CandleRow]):
+    """Batch upsert candle rows (chunks of 500)."""
+    for i in range(0, len(rows), 500):
+        await db.upsert("candle_cache", rows[i:i+500], on_conflict="symbol,timeframe,timestamp")
+
+
+def _parse_ts(value: str) -> datetime:
+    """Parse a PostgREST timestamp into a naive UTC datetime."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+async def _scan_next_symbol(symbols: list[str], calendars: dict[str, dict | None]):
+    """Pick the hot symbol with the oldest verified coverage and repair its gaps."""
+    if not symbols:
+        return
+    coverage = await db.fetch("hot_symbols", {
+        "symbol": "in.(" + ",".join(f'"{s}"' for s in symbols) + ")",
+        "select": "symbol,candle_data_since,candle_verified_until",
+    })
+    verified = {c["symbol"]: c for c in coverage}
+    symbol = min(symbols, key=lambda s: (verified.get(s) or {}).get("candle_verified_until") or "")
+    row = verified.get(symbol) or {}
+
+    now = datetime.utcnow()
+    history_start = now - timedelta(days=config.CANDLE_HISTORY_MONTHS * 30)
+    if row.get("candle_verified_until"):
+        start = max(_parse_ts(row["candle_verified_until"]), history_start)
+    else:
+        start = history_start
+
+    for tf_name in config.CANDLE_TIMEFRAMES:
+        if tf_name in TF_MAP:
+            await _backfill_gaps(symbol, tf_name, start, now, calendars.get(symbol))
+
+    # Rescan the last week next time so the newest bars of every timeframe get checked once closed
+    await db.upsert("hot_symbols", {
+        "symbol": symbol,
+        "candle_data_since": row.get("candle_data_since") or history_start.isoformat(),
+        "candle_verified_until": (now - timedelta(seconds=TF_SECONDS["W1"])).isoformat(),
+    }, on_conflict="symbol")
+
+
+async def _backfill_gaps(symbol: str, tf_name: str, start: datetime, now: datetime, calendar: dict | None):
+    """Find missing bars in [start, now) for one series and fetch only those ranges."""
+    step = timedelta(seconds=TF_SECONDS[tf_name])
+    end = now - step  # only bars that have closed
+
+    times = []
+    offset = 0
+    while True:
+        page = await db.fetch("candle_cache", {
+            "symbol": f"eq.{symbol}",
+            "timeframe": f"eq.{tf_name}",
+            "and": f"(timestamp.gte.{start.isoformat()},timestamp.lt.{end.isoformat()})",
+            "select": "timestamp",
+            "order": "timestamp.asc",
+            "limit": "1000",
+            "offset": str(offset),
+        })
+        times.extend(_parse_ts(c["timestamp"]) for c in page)
+        if len(page) < 1000:
+            break
+        offset += 1000
+
+    if not times:
+        return  # never loaded; the incremental pass does the initial fetch
+
+    # Missing ranges between consecutive bars whose span overlaps the symbol's
+    # trading sessions, with the leading edge aligned to the series' own bar grid
+    anchor = times[0] - ((times[0] - start) // step) * step
+    gaps = []
+    for prev, nxt in zip([anchor - step] + times, times + [end]):
+        t = prev + step
+        while t < nxt:
+            bar_start = sessions.bar_epoch(calendar, t)
+            if sessions.open_between(calendar, bar_start, bar_start + step.total_seconds()):
+                gaps.append((prev + step, nxt))
+                break
+            t += step
+
+    if not gaps:
+        return
+
+    # One rpyc call per cluster of nearby gaps (not one spanning the whole
+    # window); write only the bars that fall inside the gaps themselves
+    merge_within = step * config.CANDLE_GAP_MERGE_BARS
+    ranges = [list(gaps[0])]
+    for g0, g1 in gaps[1:]:
+        if g0 - ranges[-1][1] <= merge_within:
+            ranges[-1][1] = g1
+        else:
+            ranges.append([g0, g1])
+
+    rows = []
+    for r0, r1 in ranges:
+        rates = mt5.copy_rates_range(symbol, TF_MAP[tf_name], r0, r1)
+        if rates is None or len(rates) == 0:
+            continue
+        rows.extend(
+            r for r in CandleRow.from_rates(symbol, tf_name, rates)
+            if any(g0 <= datetime.fromisoformat(r.timestamp) < g1 for g0, g1 in gaps if r0 <= g0 < r1)
+        )
+    if rows:
+        logger.info(
+            f"Backfilling {len(rows)} missing {tf_name} bars for {symbol} across {len(gaps)} gaps"
+            f" ({len(ranges)} fetches)"
+        )
+        await _upsert_candles(rows)
+
+
+async def _get_hot_symbols(redis_pool: aioredis.Redis) -> list[str]:
+    """Refresh chart-subscribed symbols, prune cold ones, and return the hot set."""
+    now = time.time()
+    subscribers = await redis_pool.smembers("chart_subscribers")
+    chart_symbols = {m.split(":", 1)[1] for m in subscribers if ":" in m}
+
+    pipe = redis_pool.pipeline(transaction=False)
+    if chart_symbols:
+        pipe.zadd("hot_symbols", {sym: now for sym in chart_symbols})
+    pipe.zremrangebyscore("hot_symbols", "-inf", now - config.HOT_SYMBOL_TTL_DAYS * 86400)
+    pipe.zrange("hot_symbols", 0, -1)
+    results = await pipe.execute()
+    return results[-1]
 
-        await asyncio.sleep(config.CANDLE_UPDATE_INTERVAL)
 
+async def _flush_hot_symbols(redis_pool: aioredis.Redis):
+    """Upsert the current Redis hot set into the hot_symbols table and drop rows past the TTL."""
+    entries = await redis_pool.zrange("hot_symbols", 0, -1, withscores=True)
+    if entries:
+        rows = [
+            {"symbol": sym, "last_active": datetime.utcfromtimestamp(ts).isoformat()}
+            for sym, ts in entries
+        ]
+        await db.upsert("hot_symbols", rows, on_conflict="symbol")
+    # Same cutoff as the Redis prune, so a reseed after a Redis flush brings back no cold symbols
+    cutoff = datetime.utcnow() - timedelta(days=config.HOT_SYMBOL_TTL_DAYS)
+    await db.delete("hot_symbols", {}, {"last_active": f"lt.{cutoff.isoformat()}"})
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,69 +1,213 @@
-from pydantic import BaseModel
-from datetime import datetime
-from decimal import Decimal
-
-
-class AccountInfo(BaseModel):
-    id: str
-    user_id: str
-    broker: str
-    mt5_server: str
-    mt5_login: str
-    mt5_investor_password_encrypted: str
-    sync_enabled: bool = True
-    last_sync_at: datetime | None = None
-    sync_fail_count: int = 0
-
-
-class SyncJob(BaseModel):
-    user_id: str
-    account_id: str
-    mt5_server: str
-    mt5_login: str
-    password_encrypted: str
-    job_type: str = "lightweight"  # lightweight | full | catchup
-
-
-class TradeRecord(BaseModel):
-    ticket_number: str
-    symbol: str
-    direction: str
-    entry_timestamp: datetime
-    exit_timestamp: datetime | None = None
-    entry_price: Decimal
-    exit_price: Decimal | None = None
-    position_size: Decimal
-    pnl: Decimal | None = None
-    pnl_pips: Decimal | None = None
-    commission: Decimal = Decimal("0")
-    swap: Decimal = Decimal("0")
-    stop_loss: Decimal | None = None
-    take_profit: Decimal | None = None
-    status: str = "open"
-    import_source: str = "mt5"
-    session_tag: str | None = None
-
-
-class OpenPosition(BaseModel):
-    ticket_number: str
-    symbol: str
-    direction: str
-    entry_timestamp: datetime
-    entry_price: Decimal
-    current_price: Decimal | None = None
-    position_size: Decimal
-    floating_pnl: Decimal | None = None
-    stop_loss: Decimal | None = None
-    take_profit: Decimal | None = None
-    swap: Decimal = Decimal("0")
-
-
-class CandleData(BaseModel):
-    symbol: str
-    timeframe: str
-    timestamp: datetime
-    open: Decimal
-    high: Decimal
-    low: Decimal
-    close: Decimal
-    volume: Decimal = Decimal("0")
+"""
+Job and row records for the sync engine's hot loops.
+
+Row records use __slots__ (no per-instance dict) and serialize straight to
+the PostgREST JSON body with to_json(), so writing thousands of positions,
+trades or candles neither builds a dict per row nor walks them again in the
+json encoder. SyncJob is the Redis queue payload, packed with msgpack as a
+positional array so field names aren't repeated in every job.
+"""
+from json.encoder import encode_basestring as _str
+
+import msgpack
+import numpy as np
+
+
+def _num(value) -> str:
+    return "null" if value is None else repr(value)
+
+
+def _opt_str(value) -> str:
+    return "null" if value is None else _str(value)
+
+
+def dumps(records) -> bytes:
+    """JSON array body for a list of records."""
+    return ("[" + ",".join(r.to_json() for r in records) + "]").encode()
+
+
+class SyncJob:
+    """A sync_jobs:{lane} hash entry."""
+
+    __slots__ = (
+        "user_id", "account_id", "mt5_server", "mt5_login", "password_encrypted",
+        "job_type", "last_sync_at", "window_from", "analytics_pending",
+    )
+
+    def __init__(
+        self,
+        user_id: str,
+        account_id: str,
+        mt5_server: str,
+        mt5_login: str,
+        password_encrypted: str,
+        job_type: str = "lightweight",  # lightweight | catchup
+        last_sync_at: str | None = None,
+        window_from: str | None = None,
+        analytics_pending: bool = False,
+    ):
+        self.user_id = user_id
+        self.account_id = account_id
+        self.mt5_server = mt5_server
+        self.mt5_login = mt5_login
+        self.password_encrypted = password_encrypted
+        self.job_type = job_type
+        self.last_sync_at = last_sync_at
+        self.window_from = window_from
+        self.analytics_pending = analytics_pending
+
+    def pack(self) -> bytes:
+        return msgpack.packb([getattr(self, f) for f in self.__slots__])
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "SyncJob":
+        # Positional: fields added at the end default for payloads queued by an older build
+        return cls(*msgpack.unpackb(data))
+
+
+class TradeRow:
+    """A trades row."""
+
+    __slots__ = (
+        "user_id", "account_id", "ticket_number", "symbol", "direction",
+        "entry_timestamp", "exit_timestamp", "entry_price", "exit_price", "position_size",
+        "pnl", "commission", "swap", "status", "import_source", "session_tag",
+    )
+
+    def __init__(
+        self,
+        user_id: str,
+        account_id: str,
+        ticket_number: str,
+        symbol: str,
+        direction: str,
+        entry_timestamp: str,
+        exit_timestamp: str | None,
+        entry_price: float,
+        exit_price: float | None,
+        position_size: float,
+        pnl: float | None,
+        commission: float,
+        swap: float,
+        status: str,
+        import_source: str,
+        session_tag: str | None,
+    ):
+        self.user_id = user_id
+        self.account_id = account_id
+        self.ticket_number = ticket_number
+        self.symbol = symbol
+        self.direction = direction
+        self.entry_timestamp = entry_timestamp
+        self.exit_timestamp = exit_timestamp
+        self.entry_price = entry_price
+        self.exit_price = exit_price
+        self.position_size = position_size
+        self.pnl = pnl
+        self.commission = commission
+        self.swap = swap
+        self.status = status
+        self.import_source = import_source
+        self.session_tag = session_tag
+
+    def to_json(self) -> str:
+        return (
+            f'{{"user_id":"{self.user_id}","account_id":"{self.account_id}",'
+            f'"ticket_number":{_str(self.ticket_number)},"symbol":{_str(self.symbol)},'
+            f'"direction":"{self.direction}","entry_timestamp":"{self.entry_timestamp}",'
+            f'"exit_timestamp":{_opt_str(self.exit_timestamp)},"entry_price":{self.entry_price!r},'
+            f'"exit_price":{_num(self.exit_price)},"position_size":{self.position_size!r},'
+            f'"pnl":{_num(self.pnl)},"commission":{self.commission!r},"swap":{self.swap!r},'
+            f'"status":"{self.status}","import_source":"{self.import_source}",'
+            f'"session_tag":{_opt_str(self.session_tag)}}}'
+        )
+
+
+class PositionRow:
+    """An open_positions row."""
+
+    __slots__ = (
+        "user_id", "account_id", "ticket_number", "symbol", "direction", "entry_timestamp",
+        "entry_price", "current_price", "position_size", "floating_pnl",
+        "stop_loss", "take_profit", "swap", "synced_at",
+    )
+
+    def __init__(
+        self,
+        user_id: str,
+        account_id: str,
+        ticket_number: str,
+        symbol: str,
+        direction: str,
+        entry_timestamp: str,
+        entry_price: float,
+        current_price: float,
+        position_size: float,
+        floating_pnl: float,
+        stop_loss: float | None,
+        take_profit: float | None,
+        swap: float,
+        synced_at: str,
+    ):
+        self.user_id = user_id
+        self.account_id = account_id
+        self.ticket_number = ticket_number
+        self.symbol = symbol
+        self.direction = direction
+        self.entry_timestamp = entry_timestamp
+        self.entry_price = entry_price
+        self.current_price = current_price
+        self.position_size = position_size
+        self.floating_pnl = floating_pnl
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.swap = swap
+        self.synced_at = synced_at
+
+    def to_json(self) -> str:
+        return (
+            f'{{"user_id":"{self.user_id}","account_id":"{self.account_id}",'
+            f'"ticket_number":"{self.ticket_number}","symbol":{_str(self.symbol)},'
+            f'"direction":"{self.direction}","entry_timestamp":"{self.entry_timestamp}",'
+            f'"entry_price":{self.entry_price!r},"current_price":{self.current_price!r},'
+            f'"position_size":{self.position_size!r},"floating_pnl":{self.floating_pnl!r},'
+            f'"stop_loss":{_num(self.stop_loss)},"take_profit":{_num(self.take_profit)},'
+            f'"swap":{self.swap!r},"synced_at":"{self.synced_at}"}}'
+        )
+
+
+class CandleRow:
+    """A candle_cache row."""
+
+    __slots__ = ("symbol", "timeframe", "timestamp", "open", "high", "low", "close", "volume")
+
+    def __init__(self, symbol: str, timeframe: str, timestamp: str,
+                 open: float, high: float, low: float, close: float, volume: float):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def from_rates(cls, symbol: str, timeframe: str, rates) -> list["CandleRow"]:
+        """Rows for an MT5 rates array, converting whole columns at once."""
+        stamps = np.datetime_as_string(rates["time"].astype("datetime64[s]")).tolist()
+        return [
+            cls(symbol, timeframe, *values)
+            for values in zip(
+                stamps,
+                rates["open"].tolist(), rates["high"].tolist(), rates["low"].tolist(),
+                rates["close"].tolist(), rates["tick_volume"].astype(np.float64).tolist(),
+            )
+        ]
+
+    def to_json(self) -> str:
+        return (
+            f'{{"symbol":{_str(self.symbol)},"timeframe":"{self.timeframe}","timestamp":"{self.timestamp}",'
+            f'"open":{self.open!r},"high":{self.high!r},"low":{self.low!r},"close":{self.close!r},'
+            f'"volume":{self.volume!r}}}'
+        )
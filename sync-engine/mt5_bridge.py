@@ -3,9 +3,21 @@ MT5 Bridge — Cross-platform MetaTrader5 connection adapter.
 
 On Windows: uses MetaTrader5 package directly.
 On Linux (Docker): uses mt5linux to connect to rpyc server running under Wine.
+
+TerminalPool wraps an active terminal plus a warm standby (second rpyc server
+and terminal install in the same Wine prefix). When the active terminal's RSS
+or call latency drifts past the configured limits, the standby is initialized
+and logged in on a background thread while the active terminal keeps serving,
+then traffic switches to it and the old terminal is killed.
 """
+import asyncio
 import os
+import signal
+import time
 import logging
+from glob import glob
+
+import config
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +41,9 @@ DEAL_ENTRY_OUT = 1
 ORDER_TYPE_BUY = 0
 ORDER_TYPE_SELL = 1
 
+# Standby terminal install lives next to the primary one: "<install dir> Standby"
+STANDBY_SUFFIX = " Standby"
+
 if os.name == "nt":
     # Windows — direct MetaTrader5 package
     import MetaTrader5 as mt5
@@ -38,5 +53,223 @@ else:
     from mt5linux import MetaTrader5
     _host = os.getenv("MT5_RPYC_HOST", "localhost")
     _port = int(os.getenv("MT5_RPYC_PORT", "18812"))
+    _standby_port = int(os.getenv("MT5_RPYC_STANDBY_PORT", "18813"))
     mt5 = MetaTrader5(host=_host, port=_port)
     logger.info(f"Using mt5linux bridge to rpyc server at {_host}:{_port}")
+
+
+def find_terminal(worker_id: int) -> str | None:
+    """Locate terminal64.exe for a worker, caching the result on the Wine prefix volume."""
+    prefix = f"/opt/mt5/worker_{worker_id}"
+    cache_file = os.path.join(prefix, ".terminal_path")
+    configured = config.MT5_TERMINAL_PATH.format(worker_id=worker_id)
+
+    try:
+        with open(cache_file) as f:
+            cached = f.read().strip()
+        if cached and os.path.exists(cached):
+            return cached
+    except OSError:
+        pass
+
+    if os.path.exists(configured):
+        path = configured
+    else:
+        candidates = [c for c in glob(f"{prefix}/**/terminal64.exe", recursive=True) if STANDBY_SUFFIX not in c]
+        if not candidates:
+            return None
+        path = candidates[0]
+
+    try:
+        with open(cache_file, "w") as f:
+            f.write(path)
+    except OSError:
+        pass
+    return path
+
+
+def standby_path(terminal_path: str) -> str:
+    """Path of the standby terminal install next to the primary one."""
+    install_dir = os.path.dirname(terminal_path)
+    return os.path.join(install_dir + STANDBY_SUFFIX, os.path.basename(terminal_path))
+
+
+def _terminal_pids(terminal_path: str) -> list[int]:
+    """PIDs of Wine processes running the given terminal install."""
+    marker = os.path.basename(os.path.dirname(terminal_path))
+    pids = []
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmd = f.read().replace(b"\x00", b" ").decode(errors="ignore")
+        except OSError:
+            continue
+        if f"{marker}\\terminal64.exe" in cmd or f"{marker}/terminal64.exe" in cmd:
+            pids.append(int(pid))
+    return pids
+
+
+def terminal_rss_mb(terminal_path: str) -> float:
+    """Resident memory (MB) of the processes running the given terminal."""
+    total_kb = 0
+    for pid in _terminal_pids(terminal_path):
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+def _kill_terminal(terminal_path: str):
+    for pid in _terminal_pids(terminal_path):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+class TerminalPool:
+    """Active MT5 terminal plus a warm standby; attribute access goes to the active client."""
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.client = mt5
+        self.terminal_path = None
+        self.rss_mb = 0.0
+        self.latency_ms = 0.0
+        self._slot = 0
+        self._baseline_ms = None
+        self._samples = 0
+        self._warming = None  # (task, slot, path) while a standby starts
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def initialize(self) -> bool:
+        """Start the active terminal, falling back to the library default path."""
+        path = find_terminal(self.worker_id)
+        if path and self.client.initialize(path=path):
+            self.terminal_path = path
+            return True
+        logger.warning(f"MT5 init at {path} failed: {self.client.last_error()}, trying default path")
+        return bool(self.client.initialize())
+
+    def probe(self) -> bool:
+        """Check the terminal is alive and update RSS/latency measurements."""
+        t0 = time.perf_counter()
+        alive = self.client.terminal_info() is not None
+        latency = (time.perf_counter() - t0) * 1000
+
+        # EWMA of call latency; the baseline is the settled value after a fresh start
+        self._samples += 1
+        self.latency_ms = latency if self._samples == 1 else self.latency_ms * 0.9 + latency * 0.1
+        if self._samples == 20:
+            self._baseline_ms = self.latency_ms
+        if self.terminal_path and os.name != "nt":
+            self.rss_mb = terminal_rss_mb(self.terminal_path)
+        return alive
+
+    def recycle_reason(self) -> str | None:
+        """Why the active terminal should be recycled, if it should."""
+        if self.rss_mb > config.TERMINAL_MAX_RSS_MB:
+            return f"RSS {self.rss_mb:.0f} MB > {config.TERMINAL_MAX_RSS_MB} MB"
+        if self._baseline_ms and self.latency_ms > max(self._baseline_ms * config.TERMINAL_LATENCY_DRIFT, 50):
+            return f"latency {self.latency_ms:.0f} ms vs baseline {self._baseline_ms:.0f} ms"
+        return None
+
+    def recycle(self, warm_up=None) -> bool:
+        """Advance a due or pending recycle; call once per worker loop.
+
+        When recycle_reason() fires, the standby terminal is started and
+        `warm_up(client)` (e.g. a login, must return True) runs against it in a
+        background thread while the active terminal keeps serving. A later call
+        that finds it ready switches traffic to it, kills the old terminal and
+        returns True. A failed attempt backs off before the next one. Without a
+        standby (Windows, or no standby install) this falls back to a blocking
+        in-place restart.
+        """
+        if self._warming is None:
+            reason = self.recycle_reason()
+            if not reason or time.time() < self._retry_at:
+                return False
+            logger.info(f"Recycling terminal ({reason})")
+
+            if os.name == "nt" or not self.terminal_path or not os.path.exists(standby_path(self.terminal_path)):
+                self.client.shutdown()
+                time.sleep(2)
+                ok = bool(self.initialize() and (warm_up is None or warm_up(self.client)))
+                self._reset_stats()
+                self._backoff(ok)
+                return ok
+
+            other = 1 - self._slot
+            path = standby_path(self.terminal_path) if self._slot == 0 else find_terminal(self.worker_id)
+            task = asyncio.create_task(asyncio.to_thread(self._start_standby, other, path, warm_up))
+            self._warming = (task, other, path)
+            return False
+
+        task, other, path = self._warming
+        if not task.done():
+            return False
+        self._warming = None
+        standby = task.result()
+        self._backoff(standby is not None)
+        if standby is None:
+            return False
+
+        old_client, old_path = self.client, self.terminal_path
+        self.client, self.terminal_path, self._slot = standby, path, other
+        self._reset_stats()
+        try:
+            old_client.shutdown()
+        except Exception:
+            pass
+        _kill_terminal(old_path)
+        logger.info(f"Switched to terminal {path} on port {(_port, _standby_port)[other]}")
+        return True
+
+    @staticmethod
+    def _start_standby(slot: int, path: str, warm_up):
+        """Initialize and warm up the terminal for `slot` (worker thread); its client, or None."""
+        port = (_port, _standby_port)[slot]
+        standby = None
+        try:
+            standby = MetaTrader5(host=_host, port=port)
+            if standby.initialize(path=path) and (warm_up is None or warm_up(standby)):
+                return standby
+            logger.error(f"Standby terminal warm-up failed: {standby.last_error()}")
+        except Exception as e:
+            logger.error(f"Standby terminal on port {port} failed: {e}")
+        try:
+            if standby is not None:
+                standby.shutdown()
+        except Exception:
+            pass
+        _kill_terminal(path)
+        return None
+
+    def _backoff(self, ok: bool):
+        """Reset, or double (capped), the wait before the next recycle attempt."""
+        if ok:
+            self._failures, self._retry_at = 0, 0.0
+            return
+        self._failures += 1
+        cooldown = min(
+            config.TERMINAL_RECYCLE_COOLDOWN * 2 ** (self._failures - 1), config.TERMINAL_RECYCLE_MAX_COOLDOWN
+        )
+        self._retry_at = time.time() + cooldown
+        logger.warning(f"Terminal recycle failed, next attempt in {cooldown}s")
+
+    def _reset_stats(self):
+        self.rss_mb = 0.0
+        self.latency_ms = 0.0
+        self._baseline_ms = None
+        self._samples = 0
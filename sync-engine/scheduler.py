@@ -12,11 +12,15 @@ from datetime import datetime
 
 import jwt
 import redis.asyncio as aioredis
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query, Form, UploadFile, File
 from fastapi.responses import JSONResponse
 
+import analytics
+import circuit_breaker
 import config
 import database as db
+import importer
+from models import SyncJob
 from utils import is_market_open
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(message)s")
@@ -28,13 +32,15 @@ app = FastAPI(title="RawJournal Sync Scheduler")
 active_sessions: dict[str, dict] = {}   # user_id -> {connected_at, ws, accounts}
 grace_timers: dict[str, float] = {}      # user_id -> disconnect timestamp
 redis_pool: aioredis.Redis | None = None
+job_store: aioredis.Redis | None = None  # binary client for msgpack job payloads
 
 
 # --- Lifecycle ---
 @app.on_event("startup")
 async def startup():
-    global redis_pool
+    global redis_pool, job_store
     redis_pool = aioredis.from_url(config.REDIS_URL, decode_responses=True)
+    job_store = aioredis.from_url(config.REDIS_URL)
     logger.info("Scheduler started, connected to Redis")
     asyncio.create_task(grace_check_loop())
     asyncio.create_task(queue_builder_loop())
@@ -44,6 +50,8 @@ async def startup():
 async def shutdown():
     if redis_pool:
         await redis_pool.close()
+    if job_store:
+        await job_store.close()
 
 
 # --- Health ---
@@ -57,7 +65,23 @@ async def health():
 async def admin_status(key: str = Query(...)):
     if key != config.SUPABASE_SERVICE_KEY:
         raise HTTPException(403, "Forbidden")
-    queue_size = await redis_pool.zcard("sync_queue")
+    now = time.time()
+    lanes = {}
+    for lane in config.SYNC_LANE_WEIGHTS:
+        depth = await redis_pool.zcard(f"sync_queue:{lane}")
+        due = await redis_pool.zcount(f"sync_queue:{lane}", "-inf", now)
+        oldest = await redis_pool.zrange(f"sync_queue:{lane}", 0, 0, withscores=True)
+        stats = await redis_pool.hgetall(f"sync_lane_stats:{lane}")
+        dequeued = int(stats.get("dequeued", 0))
+        lanes[lane] = {
+            "weight": config.SYNC_LANE_WEIGHTS[lane],
+            "depth": depth,
+            "due": due,
+            "oldest_wait_s": round(max(0.0, now - oldest[0][1]), 2) if oldest else 0.0,
+            "avg_wait_s": round(float(stats.get("wait_total", 0)) / dequeued, 2) if dequeued else 0.0,
+            "last_wait_s": float(stats.get("last_wait", 0)),
+            "dequeued": dequeued,
+        }
     workers = {}
     for i in range(1, 5):
         w = await redis_pool.hgetall(f"worker:{i}:health")
@@ -65,9 +89,11 @@ async def admin_status(key: str = Query(...)):
     return {
         "active_users": len(active_sessions),
         "grace_users": len(grace_timers),
-        "queue_size": queue_size,
+        "queue_size": sum(l["depth"] for l in lanes.values()),
+        "lanes": lanes,
         "market_open": is_market_open(),
         "workers": workers,
+        "breakers": await circuit_breaker.status(redis_pool),
     }
 
 
@@ -120,6 +146,64 @@ async def ws_endpoint(websocket: WebSocket, token: str = Query(...)):
         grace_timers[user_id] = time.time()
 
 
+# --- Import ---
+@app.post("/import")
+async def import_trades(
+    token: str = Query(...),
+    account_id: str = Form(...),
+    mapping: str | None = Form(None),
+    file: UploadFile = File(...),
+):
+    """Stream-import a CSV or MT5 statement (HTML/XLSX), pushing progress over the WebSocket."""
+    user_id = _verify_token(token)
+    if not user_id:
+        raise HTTPException(401, "Invalid token")
+
+    accounts = await db.fetch("accounts", {"id": f"eq.{account_id}", "user_id": f"eq.{user_id}", "select": "id"})
+    if not accounts:
+        raise HTTPException(404, "Account not found")
+
+    # Free tier limit
+    profiles = await db.fetch("profiles", {"id": f"eq.{user_id}", "select": "subscription_tier,trade_count_this_month"})
+    profile = profiles[0] if profiles else {}
+    limit = None
+    if profile.get("subscription_tier") == "free":
+        limit = config.FREE_TIER_TRADE_LIMIT - (profile.get("trade_count_this_month") or 0)
+        if limit <= 0:
+            return JSONResponse(
+                {"error": "Free tier limit reached. Upgrade to import more trades.", "limit_reached": True},
+                status_code=403,
+            )
+
+    try:
+        column_mapping = json.loads(mapping) if mapping else None
+    except json.JSONDecodeError:
+        raise HTTPException(400, "Invalid mapping")
+
+    async def on_progress(stats: dict):
+        await push_to_user(user_id, {"type": "import_progress", "account_id": account_id, **stats})
+
+    stats = await importer.import_file(
+        user_id, account_id, file.filename or "", file.file,
+        mapping=column_mapping, limit=limit, on_progress=on_progress,
+    )
+    logger.info(f"Import for account {account_id}: {stats}")
+
+    if limit is not None and stats["imported"]:
+        await db.update(
+            "profiles", {"id": user_id},
+            {"trade_count_this_month": (profile.get("trade_count_this_month") or 0) + stats["imported"]},
+        )
+    if stats["imported"]:
+        try:
+            await analytics.refresh_analytics(user_id, account_id)
+        except Exception as e:
+            logger.error(f"Analytics refresh failed after import for account {account_id}: {e}")
+
+    await push_to_user(user_id, {"type": "import_complete", "account_id": account_id, **stats})
+    return stats
+
+
 # --- Background loops ---
 async def grace_check_loop():
     """Remove users whose grace period has expired."""
@@ -132,15 +216,17 @@ async def grace_check_loop():
             # Remove all their jobs from queue
             accounts = await db.fetch("accounts", {"user_id": f"eq.{uid}", "sync_enabled": "eq.true"})
             for acc in accounts:
-                await redis_pool.zrem("sync_queue", f"{uid}:{acc['id']}")
+                for lane in config.SYNC_LANE_WEIGHTS:
+                    await redis_pool.zrem(f"sync_queue:{lane}", f"{uid}:{acc['id']}")
             logger.info(f"User {uid} grace expired, stopped syncing")
 
 
 async def queue_builder_loop():
     """Re-queue active users' accounts on their sync interval."""
     while True:
-        interval = config.SYNC_INTERVAL if is_market_open() else 1800  # 30min weekend
-        await asyncio.sleep(interval)
+        # Workers defer accounts whose markets are closed to the next session open
+        # (and ZADD NX keeps that score), so no global weekend slowdown here
+        await asyncio.sleep(config.SYNC_INTERVAL)
 
         all_user_ids = list(active_sessions.keys()) + list(grace_timers.keys())
         for uid in all_user_ids:
@@ -154,20 +240,26 @@ async def queue_builder_loop():
 
 # --- Helpers ---
 async def _queue_sync(user_id: str, account: dict, job_type: str = "lightweight"):
-    """Add a sync job to the Redis sorted set queue."""
+    """Add a sync job to its lane's Redis sorted set queue."""
     member = f"{user_id}:{account['id']}"
+    if job_type == "catchup" and await job_store.zscore(f"sync_queue:{job_type}", member) is not None:
+        return  # Already walking history; a fresh payload would restart it from the first window
     score = time.time()
-    job_data = json.dumps({
-        "user_id": user_id,
-        "account_id": account["id"],
-        "mt5_server": account["mt5_server"],
-        "mt5_login": account["mt5_login"],
-        "password_encrypted": account["mt5_investor_password_encrypted"],
-        "job_type": job_type,
-        "last_sync_at": account.get("last_sync_at"),
-    })
-    await redis_pool.zadd("sync_queue", {member: score})
-    await redis_pool.hset("sync_jobs", member, job_data)
+    job = SyncJob(
+        user_id=user_id,
+        account_id=account["id"],
+        mt5_server=account["mt5_server"],
+        mt5_login=account["mt5_login"],
+        password_encrypted=account["mt5_investor_password_encrypted"],
+        job_type=job_type,
+        last_sync_at=account.get("last_sync_at"),
+    )
+    pipe = job_store.pipeline(transaction=False)
+    pipe.hset(f"sync_jobs:{job_type}", member, job.pack())
+    # NX: a job already waiting keeps its score, so a worker's deferral (e.g. an
+    # open broker breaker) isn't pulled forward and a due job isn't pushed back
+    pipe.zadd(f"sync_queue:{job_type}", {member: score}, nx=True)
+    await pipe.execute()
 
 
 def _verify_token(token: str) -> str | None:
@@ -0,0 +1,159 @@
+"""
+Trading-session calendar — when each symbol actually trades.
+
+A symbol's weekly schedule is a mask of 336 half-hour slots (UTC, Monday
+00:00 first) learned from its last SESSION_LOOKBACK_DAYS of M30 bars on the
+market data terminal: a slot is open if any of those weeks printed a bar in
+it. Bar times are broker server time, so they are shifted by the server's
+UTC offset (estimated from the freshest tick). symbol_info marks symbols the
+broker has disabled, and rows from the market_holidays table close extra
+ranges per symbol pattern.
+
+Calendars are cached in the Redis hash `session_calendar` (symbol -> JSON,
+"null" when the demo broker doesn't list the symbol) and rebuilt by the
+market data worker; trade workers only read them. Symbols without a
+calendar fall back to the global forex rule in utils.is_market_open().
+"""
+import json
+import logging
+import time
+from datetime import datetime
+from fnmatch import fnmatchcase
+
+import redis.asyncio as aioredis
+
+import config
+import database as db
+from mt5_bridge import TIMEFRAME_M30
+from utils import is_market_open
+
+logger = logging.getLogger(__name__)
+
+SLOT_SECONDS = 1800
+WEEK_SLOTS = 7 * 86400 // SLOT_SECONDS
+EPOCH_SLOT = 3 * 86400 // SLOT_SECONDS  # 1970-01-01 was a Thursday
+SYMBOL_TRADE_MODE_DISABLED = 0
+OPEN_SETTLE_SECONDS = 5  # first bar of a session appears with its first tick
+MAX_UTC_OFFSET = 14 * 3600
+
+
+def _slot(at: float) -> int:
+    """Half-hour slot of the week (Monday 00:00 UTC = 0) for an epoch time."""
+    return (int(at // SLOT_SECONDS) + EPOCH_SLOT) % WEEK_SLOTS
+
+
+def is_open(calendar: dict | None, at: float | None = None) -> bool:
+    """Whether a symbol trades at `at` (epoch, default now)."""
+    at = time.time() if at is None else at
+    if not calendar:
+        return is_market_open(datetime.utcfromtimestamp(at))
+    if any(start <= at < end for start, end in calendar["holidays"]):
+        return False
+    return calendar["mask"][_slot(at)] == "1"
+
+
+def open_between(calendar: dict | None, start: float, end: float) -> bool:
+    """Whether a symbol trades at any point in [start, end), looking back at most a week."""
+    t = max(start, end - 7 * 86400) // SLOT_SECONDS * SLOT_SECONDS
+    while t < end:
+        if is_open(calendar, max(t, start)):
+            return True
+        t += SLOT_SECONDS
+    return False
+
+
+def next_open(calendar: dict | None, at: float | None = None) -> float | None:
+    """Start of the next open slot after `at` within two weeks, or None."""
+    at = time.time() if at is None else at
+    t = (at // SLOT_SECONDS + 1) * SLOT_SECONDS
+    while t < at + 14 * 86400:
+        if is_open(calendar, t):
+            return t
+        t += SLOT_SECONDS
+    return None
+
+
+def bar_epoch(calendar: dict | None, bar_time: datetime) -> float:
+    """UTC epoch of a naive broker-server-time bar timestamp."""
+    offset = calendar["offset"] if calendar else 0
+    return (bar_time - datetime(1970, 1, 1)).total_seconds() - offset
+
+
+def server_offset(client, symbols: list[str], previous: int | None = None) -> int:
+    """Broker server UTC offset (seconds) from the freshest tick.
+
+    A tick only gives the offset while it is live: on a weekend the freshest
+    tick is Friday's close, which rounds to a plausible-looking but wrong
+    offset. A new value is therefore only taken while the forex market is
+    open and within MAX_UTC_OFFSET; otherwise `previous` (or 0) is kept.
+    """
+    fallback = previous or 0
+    now = time.time()
+    lags = [tick.time - now for tick in map(client.symbol_info_tick, symbols) if tick]
+    if not lags:
+        return fallback
+    freshest = max(lags)
+    offset = int(round(freshest / SLOT_SECONDS) * SLOT_SECONDS)
+    if abs(freshest - offset) >= 120 or abs(offset) > MAX_UTC_OFFSET:
+        return fallback
+    if offset != previous and not is_market_open(datetime.utcfromtimestamp(now)):
+        return fallback
+    return offset
+
+
+def build(client, symbol: str, offset: int, holidays: list[dict]) -> dict | None:
+    """Session calendar for one symbol from its recent M30 bars, or None if the broker doesn't list it."""
+    info = client.symbol_info(symbol)
+    if info is None:
+        return None
+    rates = client.copy_rates_from_pos(symbol, TIMEFRAME_M30, 0, config.SESSION_LOOKBACK_DAYS * 48)
+    if rates is None or len(rates) == 0:
+        return None
+
+    mask = bytearray(b"0" * WEEK_SLOTS)
+    for t in rates["time"]:
+        mask[_slot(int(t) - offset)] = ord("1")
+    return {
+        "mask": mask.decode(),
+        "offset": offset,
+        "tradable": info.trade_mode != SYMBOL_TRADE_MODE_DISABLED,
+        "holidays": [
+            [_epoch(h["starts_at"]), _epoch(h["ends_at"])]
+            for h in holidays if fnmatchcase(symbol, h["symbol_pattern"])
+        ],
+        "built_at": int(time.time()),
+    }
+
+
+def _epoch(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+async def load(redis_pool: aioredis.Redis, symbols) -> dict[str, dict | None]:
+    """Cached calendars for `symbols`; symbols never built are left out, unknown ones map to None."""
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    values = await redis_pool.hmget("session_calendar", symbols)
+    return {s: json.loads(v) for s, v in zip(symbols, values) if v is not None}
+
+
+async def refresh(redis_pool: aioredis.Redis, client, symbols) -> dict[str, dict | None]:
+    """Rebuild and cache calendars for `symbols` with the current holiday table."""
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    holidays = await db.fetch("market_holidays", {
+        "ends_at": f"gte.{datetime.utcnow().isoformat()}",
+        "select": "symbol_pattern,starts_at,ends_at",
+    })
+    previous = await redis_pool.get("session_server_offset")
+    offset = server_offset(client, symbols, int(previous) if previous is not None else None)
+
+    calendars = {s: build(client, s, offset, holidays) for s in symbols}
+    pipe = redis_pool.pipeline(transaction=False)
+    pipe.set("session_server_offset", offset)
+    pipe.hset("session_calendar", mapping={s: json.dumps(c) for s, c in calendars.items()})
+    await pipe.execute()
+    logger.info(f"Built session calendars for {len(symbols)} symbols (server offset {offset / 3600:+g}h)")
+    return calendars
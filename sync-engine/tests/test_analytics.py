@@ -0,0 +1,180 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import analytics
+
+
+def _trade(ticket, pnl, exit_at, symbol="EURUSD", session="london", minutes=30):
+    return {
+        "ticket_number": str(ticket),
+        "pnl": pnl,
+        "entry_timestamp": (exit_at - timedelta(minutes=minutes)).isoformat() + "+00:00",
+        "exit_timestamp": exit_at.isoformat() + "+00:00",
+        "symbol": symbol,
+        "session_tag": session,
+    }
+
+
+def _fold_all(trades, state=None):
+    return analytics.fold(state or analytics.empty_state(None), analytics._columns(trades))
+
+
+T0 = datetime(2026, 10, 12, 9)
+TRADES = [
+    _trade(1, 50.0, T0, "EURUSD", "london"),
+    _trade(2, -20.0, T0 + timedelta(hours=1), "GBPUSD", "london"),
+    _trade(3, -30.0, T0 + timedelta(hours=2), "GBPUSD", "newyork"),
+    _trade(4, 0.0, T0 + timedelta(hours=3), "EURUSD", "newyork"),
+    _trade(5, 40.0, T0 + timedelta(hours=4), "XAUUSD", "newyork", minutes=90),
+    _trade(6, 10.0, T0 + timedelta(hours=5), "EURUSD", "london"),
+]
+
+
+def test_fold_metrics():
+    m = analytics.metrics(_fold_all(TRADES))
+    assert m["total_trades"] == 6
+    assert m["winning_trades"] == 3
+    assert m["losing_trades"] == 2
+    assert m["breakeven_trades"] == 1
+    assert m["total_pnl"] == 50.0
+    assert m["profit_factor"] == 2.0
+    assert m["largest_win"] == 50.0
+    assert m["largest_loss"] == -30.0
+    assert m["max_drawdown"] == 50.0
+    assert m["max_drawdown_pct"] == 100.0
+    assert m["consecutive_wins"] == 2
+    assert m["consecutive_losses"] == 2
+    assert m["best_symbol"] == "EURUSD"
+    assert m["worst_symbol"] == "GBPUSD"
+    assert m["best_session"] == "london"
+    assert m["worst_session"] == "newyork"
+    assert m["avg_trade_duration"] == "2400 seconds"
+
+
+@pytest.mark.parametrize("split", range(1, len(TRADES)))
+def test_fold_in_batches_matches_single_fold(split):
+    state = _fold_all(TRADES[:split])
+    state = _fold_all(TRADES[split:], state)
+    assert analytics.metrics(state) == analytics.metrics(_fold_all(TRADES))
+    assert state["last_ticket"] == "6"
+
+
+def test_fold_carries_streaks_across_batches():
+    wins = [_trade(i, 1.0, T0 + timedelta(minutes=i)) for i in range(1, 7)]
+    state = _fold_all(wins[:2])
+    state = _fold_all(wins[2:4], state)
+    state = _fold_all(wins[4:], state)
+    assert state["current_win_streak"] == 6
+    assert state["max_win_streak"] == 6
+
+
+def test_fold_empty_batch_is_noop():
+    state = _fold_all(TRADES)
+    before = dict(state)
+    empty = analytics._columns([])
+    assert analytics.fold(state, empty) == before
+
+
+class FakeDb:
+    """In-memory stand-in for the PostgREST calls refresh_analytics makes."""
+
+    def __init__(self, trades, states=()):
+        self.trades = trades
+        self.states = list(states)
+        self.upserts = {}
+
+    async def fetch(self, table, params=None):
+        params = params or {}
+        if table == "analytics_state":
+            return [dict(s) for s in self.states]
+        rows = self.trades
+        since = params.get("exit_timestamp", "")
+        if since.startswith("gte."):
+            rows = [t for t in rows if analytics._epoch(t["exit_timestamp"]) >= analytics._epoch(since[4:])]
+        offset = int(params.get("offset", 0))
+        return rows[offset:offset + int(params["limit"])]
+
+    async def upsert(self, table, rows, on_conflict=""):
+        self.upserts[table] = {r["period"]: r for r in rows}
+        return rows
+
+
+@pytest.fixture
+def now(monkeypatch):
+    frozen = datetime(2026, 10, 14, 12)  # a Wednesday
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return frozen
+
+    monkeypatch.setattr(analytics, "datetime", FrozenDatetime)
+    return frozen
+
+
+def _refresh(monkeypatch, fake):
+    monkeypatch.setattr(analytics.db, "fetch", fake.fetch)
+    monkeypatch.setattr(analytics.db, "upsert", fake.upsert)
+    asyncio.run(analytics.refresh_analytics("user", "account"))
+
+
+def test_refresh_builds_every_period(monkeypatch, now):
+    trades = [
+        _trade(1, 10.0, now - timedelta(days=40)),
+        _trade(2, 20.0, now - timedelta(days=2)),
+        _trade(3, 30.0, now - timedelta(hours=1)),
+    ]
+    fake = FakeDb(trades)
+    _refresh(monkeypatch, fake)
+    cache = fake.upserts["analytics_cache"]
+    assert {p: cache[p]["total_trades"] for p in cache} == {"today": 1, "week": 2, "month": 2, "year": 3, "all": 3}
+    assert cache["week"]["total_pnl"] == 50.0
+
+
+def test_refresh_folds_only_past_watermark(monkeypatch, now):
+    trades = [_trade(1, 10.0, now - timedelta(days=40)), _trade(2, 20.0, now - timedelta(hours=2))]
+    fake = FakeDb(trades)
+    _refresh(monkeypatch, fake)
+
+    fake.states = list(fake.upserts["analytics_state"].values())
+    fake.trades = trades + [_trade(3, 5.0, now - timedelta(hours=1))]
+    _refresh(monkeypatch, fake)
+    cache = fake.upserts["analytics_cache"]
+    assert cache["all"]["total_trades"] == 3
+    assert cache["all"]["total_pnl"] == 35.0
+    assert cache["today"]["total_trades"] == 2
+
+
+def test_refresh_without_watermark_ignores_trades_before_period(monkeypatch, now):
+    # "today" has a state with nothing folded yet; the fetch still returns
+    # older trades because "all" needs them
+    states = [
+        {**analytics.empty_state(start), "period": p}
+        for p, start in analytics.period_starts(now).items()
+    ]
+    states[-1]["needs_rebuild"] = True  # "all"
+    trades = [_trade(1, 10.0, now - timedelta(days=3)), _trade(2, 20.0, now - timedelta(hours=1))]
+    fake = FakeDb(trades, states)
+    _refresh(monkeypatch, fake)
+    cache = fake.upserts["analytics_cache"]
+    assert cache["today"]["total_trades"] == 1
+    assert cache["today"]["total_pnl"] == 20.0
+    assert cache["all"]["total_trades"] == 2
+
+
+def test_refresh_with_nothing_new_writes_nothing(monkeypatch, now):
+    fake = FakeDb([_trade(1, 10.0, now - timedelta(hours=1))])
+    _refresh(monkeypatch, fake)
+    fake.states = list(fake.upserts["analytics_state"].values())
+    fake.upserts = {}
+    _refresh(monkeypatch, fake)
+    assert fake.upserts == {}
+
+
+def test_columns_group_codes():
+    cols = analytics._columns(TRADES)
+    assert list(cols["symbols"]) == ["EURUSD", "GBPUSD", "XAUUSD"]
+    assert np.array_equal(cols["symbols"][cols["symbol_codes"]], [t["symbol"] for t in TRADES])
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+import circuit_breaker
+import config
+
+fakeredis = pytest.importorskip("fakeredis")
+
+SERVER = "Broker-Live"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_800_000_000.0]
+    monkeypatch.setattr(circuit_breaker.time, "time", lambda: now[0])
+    monkeypatch.setattr(circuit_breaker.random, "uniform", lambda a, b: 0.0)
+    return now
+
+
+def _run(coro_fn):
+    async def go():
+        redis_pool = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        return await coro_fn(redis_pool)
+    return asyncio.run(go())
+
+
+async def _fail(redis_pool, *accounts):
+    return [await circuit_breaker.record(redis_pool, SERVER, a, ok=False) for a in accounts]
+
+
+def test_single_bad_password_does_not_open(clock):
+    async def scenario(r):
+        await circuit_breaker.record(r, SERVER, "ok1", ok=True)
+        await circuit_breaker.record(r, SERVER, "ok2", ok=True)
+        assert await _fail(r, "bad", "bad", "bad") == [None, None, None]
+        return await circuit_breaker.admit(r, SERVER)
+    assert _run(scenario) == (None, False)
+
+
+def test_opens_on_failure_rate_and_defers(clock):
+    async def scenario(r):
+        deferrals = await _fail(r, "a", "b", "c")
+        assert deferrals[:2] == [None, None]
+        assert deferrals[2] == clock[0] + config.BREAKER_COOLDOWN
+        defer_until, probe = await circuit_breaker.admit(r, SERVER)
+        assert defer_until == clock[0] + config.BREAKER_COOLDOWN and not probe
+        assert (await r.hgetall(f"breaker:{SERVER}"))["state"] == "open"
+    _run(scenario)
+
+
+def test_half_open_probe_is_exclusive(clock):
+    async def scenario(r):
+        await _fail(r, "a", "b", "c")
+        clock[0] += config.BREAKER_COOLDOWN
+        assert await circuit_breaker.admit(r, SERVER) == (None, True)
+        assert (await r.hgetall(f"breaker:{SERVER}"))["state"] == "half_open"
+        defer_until, probe = await circuit_breaker.admit(r, SERVER)
+        assert defer_until == clock[0] + config.BREAKER_PROBE_TIMEOUT and not probe
+    _run(scenario)
+
+
+def test_failed_probe_doubles_cooldown(clock):
+    async def scenario(r):
+        await _fail(r, "a", "b", "c")
+        clock[0] += config.BREAKER_COOLDOWN
+        await circuit_breaker.admit(r, SERVER)
+        await circuit_breaker.record(r, SERVER, "d", ok=False, probe=True)
+        assert float((await r.hgetall(f"breaker:{SERVER}"))["cooldown"]) == config.BREAKER_COOLDOWN * 2
+        assert not await r.exists(f"breaker_probe:{SERVER}")
+    _run(scenario)
+
+
+def test_close_forgets_the_outage(clock):
+    async def scenario(r):
+        await _fail(r, "a", "b", "c")
+        clock[0] += config.BREAKER_COOLDOWN
+        await circuit_breaker.admit(r, SERVER)
+        assert await circuit_breaker.record(r, SERVER, "a", ok=True, probe=True) is None
+        assert await circuit_breaker.admit(r, SERVER) == (None, False)
+        # One unrelated bad password right after recovery must not reopen it
+        assert await _fail(r, "d") == [None]
+        return await circuit_breaker.status(r)
+    assert _run(scenario) == {}
@@ -0,0 +1,149 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+import importer
+import models
+
+CSV_HEADER = "Time,Deal,Symbol,Type,Direction,Volume,Price,Position,Commission,Swap,Profit\n"
+
+
+class FakeTrades:
+    """trades table behind db.upsert, keyed by ticket (the account is fixed per test)."""
+
+    def __init__(self, existing=()):
+        self.rows = {r["ticket_number"]: r for r in existing}
+
+    async def upsert(self, table, rows, on_conflict="", ignore_duplicates=False):
+        assert table == "trades"
+        rows = json.loads(models.dumps(rows))
+        tickets = [r["ticket_number"] for r in rows]
+        assert len(tickets) == len(set(tickets)), "same row twice in one upsert"
+        written = []
+        for r in rows:
+            if ignore_duplicates and r["ticket_number"] in self.rows:
+                continue
+            self.rows[r["ticket_number"]] = r
+            written.append(r)
+        return written
+
+
+@pytest.fixture
+def trades(monkeypatch):
+    fake = FakeTrades()
+    monkeypatch.setattr(importer.db, "upsert", fake.upsert)
+    return fake
+
+
+def _import(text, filename="deals.csv", **kwargs):
+    return asyncio.run(importer.import_file("user", "account", filename, io.BytesIO(text.encode()), **kwargs))
+
+
+def test_existing_tickets_are_left_alone(trades):
+    trades.rows["11"] = {"ticket_number": "11", "import_source": "mt5", "pnl": 99.0}
+    stats = _import(
+        CSV_HEADER
+        + "2024.01.02 10:00:00,1,EURUSD,buy,in,1.0,1.1,11,0,0,0\n"
+        + "2024.01.02 11:00:00,2,EURUSD,sell,out,1.0,1.102,11,0,0,100\n"
+        + "2024.01.02 12:00:00,3,EURUSD,buy,in,0.1,1.2,12,0,0,0\n"
+        + "2024.01.02 13:00:00,4,EURUSD,sell,out,0.1,1.21,12,0,0,10\n"
+    )
+    assert stats["imported"] == 1
+    assert trades.rows["11"] == {"ticket_number": "11", "import_source": "mt5", "pnl": 99.0}
+    assert trades.rows["12"]["import_source"] == "csv"
+
+
+def test_partial_close_in_a_later_batch_updates_the_imported_trade(trades, monkeypatch):
+    monkeypatch.setattr(importer.config, "IMPORT_BATCH_SIZE", 1)
+    stats = _import(
+        CSV_HEADER
+        + "2024.01.02 10:00:00,1,EURUSD,buy,in,1.0,1.1,11,-1,0,0\n"
+        + "2024.01.02 11:00:00,2,EURUSD,sell,out,0.5,1.102,11,-0.5,0,100\n"
+        + "2024.01.02 12:00:00,3,EURUSD,sell,out,0.5,1.105,11,-0.5,0,50\n"
+    )
+    assert stats == {"total": 1, "imported": 1, "errors": 0, "limit_reached": False}
+    row = trades.rows["11"]
+    assert (row["entry_price"], row["exit_price"], row["pnl"], row["commission"]) == (1.1, 1.105, 150.0, -2.0)
+
+
+def test_limit_counts_new_trades_only(trades):
+    stats = _import(
+        CSV_HEADER + "".join(
+            f"2024.01.02 1{i}:00:00,{i},EURUSD,buy,in,0.1,1.1,{i},0,0,0\n"
+            f"2024.01.02 1{i}:30:00,{i}0,EURUSD,sell,out,0.1,1.1,{i},0,0,1\n"
+            for i in range(1, 5)
+        ),
+        limit=2,
+    )
+    assert stats["imported"] == 2 and stats["limit_reached"]
+    assert len(trades.rows) == 2
+
+
+def _rows(deals, pending=None):
+    return importer._trades("user", "account", iter(deals), True, None, {} if pending is None else pending)
+
+
+def test_fifo_by_volume_without_position_column():
+    header = ["Time", "Deal", "Symbol", "Type", "Direction", "Volume", "Price", "Order", "Profit"]
+    deals = [
+        header,
+        ["2024.01.02 10:00:00", "1", "EURUSD", "buy", "in", "1.0", "1.1", "101", "0"],
+        ["2024.01.02 10:05:00", "2", "EURUSD", "buy", "in", "0.5", "1.2", "102", "0"],
+        ["2024.01.02 11:00:00", "3", "EURUSD", "sell", "out", "0.6", "1.15", "103", "30"],
+        ["2024.01.02 12:00:00", "4", "EURUSD", "sell", "out", "0.4", "1.16", "104", "24"],
+        ["2024.01.02 13:00:00", "5", "EURUSD", "sell", "out", "0.5", "1.25", "105", "25"],
+    ]
+    rows = {t.ticket_number: t for batch in _rows(deals) for t in batch}
+    assert set(rows) == {"101", "102"}
+    assert (rows["101"].entry_price, rows["101"].exit_price, rows["101"].pnl) == (1.1, 1.16, 54.0)
+    assert (rows["102"].entry_price, rows["102"].exit_price, rows["102"].pnl) == (1.2, 1.25, 25.0)
+
+
+def test_csv_rows_sniff_semicolons_and_bom():
+    data = "﻿Time;Symbol\n2024.01.02 10:00:00;EURUSD\n".encode("utf-8")
+    assert list(importer._csv_rows(io.BytesIO(data))) == [["Time", "Symbol"], ["2024.01.02 10:00:00", "EURUSD"]]
+
+
+def test_html_rows_across_chunks(monkeypatch):
+    monkeypatch.setattr(importer, "CHUNK_SIZE", 7)
+    html = (
+        "<html><table><tr><th>Time</th><th>Symbol</th></tr>"
+        "<tr><td> 2024.01.02 </td><td>EUR<b>USD</b></td></tr></table>"
+    )
+    data = html.encode("utf-16")  # MT5 saves HTML statements as UTF-16 with a BOM
+    assert list(importer._html_rows(io.BytesIO(data))) == [["Time", "Symbol"], ["2024.01.02", "EURUSD"]]
+
+
+def test_statement_skips_preamble_before_deals_table():
+    deals = [
+        ["Trade History Report"],
+        ["Account:", "12345"],
+        ["Time", "Deal", "Symbol", "Type", "Direction", "Volume", "Price", "Position", "Profit"],
+        ["2024.01.02 10:00:00", "1", "EURUSD", "buy", "in", "1.0", "1.1", "11", "0"],
+    ]
+    [[row]] = list(_rows(deals))
+    assert (row.ticket_number, row.status) == ("11", "open")
+
+
+def test_xlsx_rows():
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Time", "Volume", None])
+    sheet.append(["2024.01.02 10:00:00", 0.5, " x "])
+    buf = io.BytesIO()
+    workbook.save(buf)
+    buf.seek(0)
+    assert list(importer._xlsx_rows(buf)) == [["Time", "Volume", ""], ["2024.01.02 10:00:00", "0.5", "x"]]
+
+
+def test_generic_csv_maps_columns(trades):
+    stats = _import(
+        "Ticket,Symbol,Type,Open Time,Close Time,Open Price,Close Price,Volume,Profit\n"
+        "7,eur/usd,Sell,2024-01-02 10:00:00,2024-01-02 11:00:00,1.1,1.09,0.2,20\n"
+    )
+    assert stats["imported"] == 1
+    row = trades.rows["7"]
+    assert (row["symbol"], row["direction"], row["status"], row["pnl"]) == ("EURUSD", "sell", "closed", 20.0)
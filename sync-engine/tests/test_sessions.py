@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import sessions
+
+
+def _epoch(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+class FakeClient:
+    """symbol_info_tick() for ticks at fixed broker-server times."""
+
+    def __init__(self, ticks: dict):
+        self.ticks = ticks
+
+    def symbol_info_tick(self, symbol):
+        at = self.ticks.get(symbol)
+        return SimpleNamespace(time=int(at)) if at is not None else None
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    def set_now(at):
+        monkeypatch.setattr(sessions.time, "time", lambda: at)
+    return set_now
+
+
+UTC3 = 3 * 3600
+
+
+def test_offset_from_live_tick(clock):
+    now = _epoch(2026, 10, 14, 12, 0, 30)  # Wednesday
+    clock(now)
+    client = FakeClient({"EURUSD": now + UTC3 - 1})
+    assert sessions.server_offset(client, ["EURUSD"], None) == UTC3
+
+
+def test_offset_follows_dst_change_while_open(clock):
+    now = _epoch(2026, 10, 26, 9, 0, 0)  # Monday
+    clock(now)
+    client = FakeClient({"EURUSD": now + 2 * 3600})
+    assert sessions.server_offset(client, ["EURUSD"], UTC3) == 2 * 3600
+
+
+def test_stale_weekend_tick_keeps_previous(clock):
+    clock(_epoch(2026, 10, 17, 12, 0, 30))  # Saturday
+    friday_close = _epoch(2026, 10, 16, 21, 59, 30) + UTC3
+    client = FakeClient({"EURUSD": friday_close, "GBPUSD": friday_close - 5})
+    assert sessions.server_offset(client, ["EURUSD", "GBPUSD"], UTC3) == UTC3
+    assert sessions.server_offset(client, ["EURUSD", "GBPUSD"], None) == 0
+
+
+def test_implausible_offset_rejected(clock):
+    now = _epoch(2026, 10, 14, 12, 0, 0)
+    clock(now)
+    client = FakeClient({"US30": now - 16 * 3600})  # closed since yesterday
+    assert sessions.server_offset(client, ["US30"], UTC3) == UTC3
+
+
+def test_no_ticks_keeps_previous(clock):
+    clock(_epoch(2026, 10, 14, 12))
+    assert sessions.server_offset(FakeClient({}), ["EURUSD"], UTC3) == UTC3
@@ -0,0 +1,64 @@
+from collections import namedtuple
+
+from utils import deals_to_trades
+
+Deal = namedtuple("Deal", "time position_id symbol type entry price volume profit commission swap")
+
+T0 = 1_704_189_600  # 2024-01-02 10:00 UTC
+BUY, SELL = 0, 1
+IN, OUT = 0, 1
+
+
+def _deal(minutes, position, type_, entry, price, volume=1.0, profit=0.0, commission=0.0, swap=0.0):
+    return Deal(T0 + minutes * 60, position, "EURUSD", type_, entry, price, volume, profit, commission, swap)
+
+
+def test_pairs_entry_and_exit():
+    [row] = deals_to_trades("u", "a", [
+        _deal(0, 11, BUY, IN, 1.1, commission=-1.0),
+        _deal(60, 11, SELL, OUT, 1.102, profit=20.0, commission=-1.0, swap=-0.5),
+    ])
+    assert row.ticket_number == "11"
+    assert row.direction == "buy"
+    assert (row.entry_price, row.exit_price, row.pnl) == (1.1, 1.102, 20.0)
+    assert (row.commission, row.swap) == (-2.0, -0.5)
+    assert row.entry_timestamp == "2024-01-02T10:00:00"
+    assert row.exit_timestamp == "2024-01-02T11:00:00"
+    assert row.session_tag == "london"
+    assert row.status == "closed"
+
+
+def test_open_position_without_pending_is_returned_open():
+    [row] = deals_to_trades("u", "a", [_deal(0, 11, SELL, IN, 1.1)])
+    assert row.direction == "sell"
+    assert row.status == "open"
+    assert row.exit_price is None and row.pnl is None
+
+
+def test_exit_without_known_entry_uses_its_own_side():
+    [row] = deals_to_trades("u", "a", [_deal(30, 11, SELL, OUT, 1.2, volume=0.5, profit=7.0)])
+    # Selling to close means the position was a buy
+    assert row.direction == "buy"
+    assert (row.entry_price, row.exit_price, row.position_size, row.pnl) == (1.2, 1.2, 0.5, 7.0)
+    assert row.entry_timestamp == row.exit_timestamp
+
+
+def test_partial_close_across_batches_merges_into_one_row():
+    pending, closed = {}, {}
+    first = deals_to_trades("u", "a", [_deal(0, 11, BUY, IN, 1.1)], pending, closed=closed)
+    assert first == [] and "11" in pending
+
+    exit1 = _deal(60, 11, SELL, OUT, 1.102, volume=0.5, profit=100.0)
+    exit2 = _deal(120, 11, SELL, OUT, 1.105, volume=0.5, profit=50.0)
+    second = deals_to_trades("u", "a", [exit1], pending, closed=closed)
+    third = deals_to_trades("u", "a", [exit2], pending, closed=closed)
+    assert second[0] is third[0]
+    row = third[0]
+    assert (row.entry_price, row.exit_price, row.position_size, row.pnl) == (1.1, 1.105, 1.0, 150.0)
+    assert row.entry_timestamp == "2024-01-02T10:00:00"
+    assert not pending
+
+
+def test_non_trade_deals_are_skipped():
+    balance = Deal(T0, 0, "", 2, 0, 0.0, 0.0, 1000.0, 0.0, 0.0)
+    assert deals_to_trades("u", "a", [balance]) == []
@@ -7,20 +7,21 @@ and writes results to Supabase.
 """
 import argparse
 import asyncio
-import json
 import logging
 import time
-from glob import glob
 from datetime import datetime, timedelta
 
 import redis.asyncio as aioredis
 
+import analytics
+import circuit_breaker
 import config
-from mt5_bridge import mt5
+from mt5_bridge import TerminalPool
 import database as db
+import sessions
 from encryption import decrypt
-from models import TradeRecord, OpenPosition
-from utils import get_session_tag, is_market_open
+from models import PositionRow, SyncJob
+from utils import deals_to_trades
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [worker-%(worker_id)s] %(message)s")
 
@@ -30,101 +31,145 @@ args = parser.parse_args()
 
 worker_id = args.worker_id
 logger = logging.getLogger(f"worker-{worker_id}")
+mt5 = TerminalPool(worker_id)
 
 
 async def main():
     redis_pool = aioredis.from_url(config.REDIS_URL, decode_responses=True)
-    terminal_path = config.MT5_TERMINAL_PATH.format(worker_id=worker_id)
-
-    logger.info(f"Initializing MT5 terminal at {terminal_path}")
-    if not mt5.initialize(path=terminal_path):
-        logger.warning(f"MT5 init with configured path failed: {mt5.last_error()}")
-
-        candidates = glob(f"/opt/mt5/worker_{worker_id}/**/terminal64.exe", recursive=True)
-        for candidate in candidates:
-            logger.info(f"Trying alternate MT5 path: {candidate}")
-            if mt5.initialize(path=candidate):
-                terminal_path = candidate
-                break
-        else:
-            logger.info("Trying MT5 initialize() without path as fallback")
-            if not mt5.initialize():
-                logger.error(f"MT5 init failed: {mt5.last_error()}")
-                return
+    job_store = aioredis.from_url(config.REDIS_URL)  # binary: msgpack job payloads
+
+    logger.info("Initializing MT5 terminal")
+    if not mt5.initialize():
+        logger.error(f"MT5 init failed: {mt5.last_error()}")
+        return
 
     cycles = 0
     start_time = time.time()
     current_server = None
+    lane_credit = {lane: 0 for lane in config.SYNC_LANE_WEIGHTS}
 
     while True:
         # Report health
+        terminal_alive = mt5.probe()
         uptime = (time.time() - start_time) / 3600
         await redis_pool.hset(f"worker:{worker_id}:health", mapping={
             "status": "running",
-            "terminal_alive": str(mt5.terminal_info() is not None),
+            "terminal_alive": str(terminal_alive),
             "current_server": current_server or "idle",
             "cycles": str(cycles),
             "uptime_hours": f"{uptime:.1f}",
+            "terminal_rss_mb": f"{mt5.rss_mb:.0f}",
+            "call_latency_ms": f"{mt5.latency_ms:.1f}",
         })
 
-        # Terminal restart every N hours
-        if uptime > config.TERMINAL_RESTART_HOURS:
-            logger.info("Restarting terminal (memory leak prevention)")
-            mt5.shutdown()
-            await asyncio.sleep(2)
-            mt5.initialize(path=terminal_path)
+        # Recycle the terminal onto the warm standby when memory or latency drifts
+        if mt5.recycle():
             start_time = time.time()
             current_server = None
 
-        # Weekend mode: sleep longer
-        if not is_market_open():
-            await asyncio.sleep(60)
-            continue
-
-        # Pop next job from queue
-        jobs = await redis_pool.zrangebyscore("sync_queue", "-inf", str(time.time()), start=0, num=1)
-        if not jobs:
+        # Pick a lane: smooth weighted round-robin over lanes that have a due job
+        now = time.time()
+        pipe = redis_pool.pipeline(transaction=False)
+        for lane in config.SYNC_LANE_WEIGHTS:
+            pipe.zrangebyscore(f"sync_queue:{lane}", "-inf", str(now), start=0, num=1, withscores=True)
+        heads = await pipe.execute()
+        due = {lane: jobs[0] for lane, jobs in zip(config.SYNC_LANE_WEIGHTS, heads) if jobs}
+        if not due:
             await asyncio.sleep(1)
             continue
 
-        member = jobs[0]
-        await redis_pool.zrem("sync_queue", member)
-        job_json = await redis_pool.hget("sync_jobs", member)
-        if not job_json:
+        for lane in due:
+            lane_credit[lane] += config.SYNC_LANE_WEIGHTS[lane]
+        lane = max(due, key=lane_credit.get)
+        lane_credit[lane] -= sum(config.SYNC_LANE_WEIGHTS[l] for l in due)
+
+        member, score = due[lane]
+        if not await redis_pool.zrem(f"sync_queue:{lane}", member):
+            continue  # Claimed by another worker
+        job_data = await job_store.hget(f"sync_jobs:{lane}", member)
+        if not job_data:
             continue
 
-        job = json.loads(job_json)
-        user_id = job["user_id"]
-        account_id = job["account_id"]
+        # Lane wait metrics for /admin/status
+        wait = max(0.0, now - score)
+        pipe = redis_pool.pipeline(transaction=False)
+        pipe.hincrby(f"sync_lane_stats:{lane}", "dequeued", 1)
+        pipe.hincrbyfloat(f"sync_lane_stats:{lane}", "wait_total", wait)
+        pipe.hset(f"sync_lane_stats:{lane}", "last_wait", f"{wait:.2f}")
+        await pipe.execute()
 
         try:
+            job = SyncJob.unpack(job_data)
+        except (ValueError, TypeError):
+            continue  # Payload from an older build; the scheduler re-queues the account
+        user_id = job.user_id
+        account_id = job.account_id
+
+        try:
+            server = job.mt5_server
+
+            # Every market the account trades is closed: skip the login until the next session open
+            if lane == "lightweight":
+                defer_until = await _closed_until(redis_pool, account_id)
+                if defer_until:
+                    await redis_pool.zadd(f"sync_queue:{lane}", {member: defer_until})
+                    continue
+
+            # Broker server down: push the job past its breaker cooldown without logging in
+            defer_until, probe = await circuit_breaker.admit(redis_pool, server)
+            if defer_until:
+                await redis_pool.zadd(f"sync_queue:{lane}", {member: defer_until})
+                continue
+
             # Decrypt password
-            password = decrypt(job["password_encrypted"])
-            login = int(job["mt5_login"])
-            server = job["mt5_server"]
+            password = decrypt(job.password_encrypted)
+            login = int(job.mt5_login)
 
             # Login to MT5 account
             ok = mt5.login(login, password=password, server=server, timeout=10000)
             if not ok:
                 err = mt5.last_error()
                 logger.warning(f"Login failed for {login}@{server}: {err}")
-                await _handle_login_failure(account_id, str(err))
+                defer_until = await circuit_breaker.record(redis_pool, server, account_id, ok=False, probe=probe)
+                if defer_until:
+                    # Broker outage, not the account's fault: retry after the cooldown
+                    await redis_pool.zadd(f"sync_queue:{lane}", {member: defer_until})
+                else:
+                    await _handle_login_failure(account_id, str(err))
                 continue
+            await circuit_breaker.record(redis_pool, server, account_id, ok=True, probe=probe)
 
             current_server = server
 
-            # Determine sync type
-            job_type = job.get("job_type", "lightweight")
-            full_check = job_type in ("full", "catchup") or (cycles % 4 == 0)
-
             # Always: sync open positions + account balance
-            await _sync_positions(user_id, account_id)
+            await _sync_positions(redis_pool, user_id, account_id)
             await _sync_balance(account_id)
 
-            # Full check: fetch closed trades
-            if full_check:
-                last_sync = job.get("last_sync_at")
-                await _sync_closed_trades(user_id, account_id, last_sync, is_catchup=job_type == "catchup")
+            # Closed trades: catchup jobs walk history one window per dequeue;
+            # lightweight jobs only pick up deals since the last sync every 4th cycle
+            last_sync = job.last_sync_at
+            next_window = None
+            if lane == "lightweight":
+                if last_sync and cycles % 4 == 0:
+                    if await _sync_closed_trades(
+                        redis_pool, user_id, account_id, _parse_ts(last_sync), datetime.utcnow()
+                    ):
+                        job.analytics_pending = True
+            else:
+                from_date = datetime.fromisoformat(job.window_from) if job.window_from else datetime(2020, 1, 1)
+                to_date = min(from_date + timedelta(days=config.CATCHUP_WINDOW_DAYS), datetime.utcnow())
+                if await _sync_closed_trades(redis_pool, user_id, account_id, from_date, to_date):
+                    job.analytics_pending = True
+                if to_date < datetime.utcnow():
+                    next_window = to_date
+
+            # Fold new closed trades into analytics (after the last window for chunked jobs)
+            if job.analytics_pending and not next_window:
+                try:
+                    await analytics.refresh_analytics(user_id, account_id)
+                except Exception as e:
+                    logger.error(f"Analytics refresh failed for account {account_id}: {e}")
+                job.analytics_pending = False
 
             # Update last sync
             await db.update("accounts", {"id": account_id}, {
@@ -133,9 +178,17 @@ async def main():
                 "sync_fail_count": 0,
             })
 
-            # Re-queue for next cycle
-            score = time.time() + config.SYNC_INTERVAL
-            await redis_pool.zadd("sync_queue", {member: score})
+            if next_window:
+                # Yield: put the next window at the back of its lane so other lanes get served
+                job.window_from = next_window.isoformat()
+                pipe = job_store.pipeline(transaction=False)
+                pipe.hset(f"sync_jobs:{lane}", member, job.pack())
+                pipe.zadd(f"sync_queue:{lane}", {member: time.time()})
+                await pipe.execute()
+            elif lane == "lightweight":
+                # Re-queue for next cycle
+                score = time.time() + config.SYNC_INTERVAL
+                await redis_pool.zadd("sync_queue:lightweight", {member: score})
 
             cycles += 1
 
@@ -145,12 +198,12 @@ async def main():
                 "last_sync_status": "error",
                 "last_sync_error": str(e)[:500],
             })
-            # Re-queue with delay
-            score = time.time() + config.SYNC_INTERVAL * 2
-            await redis_pool.zadd("sync_queue", {member: score})
+            # Re-queue with a jittered delay
+            score = circuit_breaker.jittered(time.time() + config.SYNC_INTERVAL * 2, config.SYNC_INTERVAL * 2)
+            await redis_pool.zadd(f"sync_queue:{lane}", {member: score})
 
 
-async def _sync_positions(user_id: str, account_id: str):
+async def _sync_positions(redis_pool: aioredis.Redis, user_id: str, account_id: str):
     """Fetch and upsert open positions."""
     positions = mt5.positions_get()
     if positions is None:
@@ -162,32 +215,38 @@ async def _sync_positions(user_id: str, account_id: str):
     if not positions:
         return
 
-    rows = []
-    for p in positions:
-        rows.append({
-            "user_id": user_id,
-            "account_id": account_id,
-            "ticket_number": str(p.ticket),
-            "symbol": p.symbol,
-            "direction": "buy" if p.type == 0 else "sell",
-            "entry_timestamp": datetime.utcfromtimestamp(p.time).isoformat(),
-            "entry_price": float(p.price_open),
-            "current_price": float(p.price_current),
-            "position_size": float(p.volume),
-            "floating_pnl": float(p.profit),
-            "stop_loss": float(p.sl) if p.sl else None,
-            "take_profit": float(p.tp) if p.tp else None,
-            "swap": float(p.swap),
-            "synced_at": datetime.utcnow().isoformat(),
-        })
+    synced_at = datetime.utcnow().isoformat()
+    rows = [
+        PositionRow(
+            user_id=user_id,
+            account_id=account_id,
+            ticket_number=str(p.ticket),
+            symbol=p.symbol,
+            direction="buy" if p.type == 0 else "sell",
+            entry_timestamp=datetime.utcfromtimestamp(p.time).isoformat(),
+            entry_price=float(p.price_open),
+            current_price=float(p.price_current),
+            position_size=float(p.volume),
+            floating_pnl=float(p.profit),
+            stop_loss=float(p.sl) if p.sl else None,
+            take_profit=float(p.tp) if p.tp else None,
+            swap=float(p.swap),
+            synced_at=synced_at,
+        )
+        for p in positions
+    ]
 
     if rows:
         await db.insert("open_positions", rows)
 
-    # Update hot symbols
-    symbols = list({p.symbol for p in positions})
-    for sym in symbols:
-        await db.upsert("hot_symbols", {"symbol": sym, "last_active": datetime.utcnow().isoformat()}, on_conflict="symbol")
+    # Mark symbols hot in Redis (market data worker flushes snapshots to Postgres)
+    now = time.time()
+    await _track_symbols(redis_pool, account_id, {p.symbol: now for p in positions}, hot=True)
+
+
+def _parse_ts(value: str) -> datetime:
+    """Parse a PostgREST timestamp into a naive UTC datetime."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
 
 
 async def _sync_balance(account_id: str):
@@ -200,61 +259,72 @@ async def _sync_balance(account_id: str):
         })
 
 
-async def _sync_closed_trades(user_id: str, account_id: str, last_sync: str | None, is_catchup: bool):
-    """Fetch closed trades since last sync."""
-    if last_sync and not is_catchup:
-        from_date = datetime.fromisoformat(last_sync)
-    else:
-        # First sync or catch-up: get all history
-        from_date = datetime(2020, 1, 1)
-
-    to_date = datetime.utcnow()
+async def _sync_closed_trades(
+    redis_pool: aioredis.Redis, user_id: str, account_id: str, from_date: datetime, to_date: datetime
+) -> int:
+    """Fetch closed trades in [from_date, to_date]; returns the number of trade rows written."""
     deals = mt5.history_deals_get(from_date, to_date)
     if not deals:
-        return
+        return 0
 
-    # Filter to trade entries/exits (types 0=buy, 1=sell)
-    trade_deals = [d for d in deals if d.entry in (0, 1) and d.type in (0, 1)]
-
-    rows = []
-    for d in trade_deals:
-        entry_time = datetime.utcfromtimestamp(d.time)
-        rows.append({
-            "user_id": user_id,
-            "account_id": account_id,
-            "ticket_number": str(d.position_id),
-            "symbol": d.symbol,
-            "direction": "buy" if d.type == 0 else "sell",
-            "entry_timestamp": entry_time.isoformat(),
-            "exit_timestamp": datetime.utcfromtimestamp(d.time).isoformat() if d.entry == 1 else None,
-            "entry_price": float(d.price),
-            "exit_price": float(d.price) if d.entry == 1 else None,
-            "position_size": float(d.volume),
-            "pnl": float(d.profit) if d.entry == 1 else None,
-            "commission": float(d.commission),
-            "swap": float(d.swap),
-            "status": "closed" if d.entry == 1 else "open",
-            "import_source": "mt5",
-            "session_tag": get_session_tag(entry_time),
-        })
+    # Positions that closed in the window but opened before it: pull their whole
+    # deal history so the row keeps its real entry side instead of the exit's
+    entered = {d.position_id for d in deals if d.entry == 0}
+    orphans = {d.position_id for d in deals if d.entry == 1 and d.position_id not in entered}
+    if orphans:
+        deals = [d for d in deals if d.position_id not in orphans]
+        for position_id in orphans:
+            deals.extend(mt5.history_deals_get(position=position_id) or ())
+        deals.sort(key=lambda d: d.time)
+
+    # Entries/exits of buy/sell deals, paired into one row per position
+    rows = deals_to_trades(user_id, account_id, deals)
 
     if rows:
         await db.upsert("trades", rows, on_conflict="account_id,ticket_number")
+        await _track_symbols(redis_pool, account_id, {d.symbol: float(d.time) for d in deals if d.symbol})
+    return len(rows)
+
+
+async def _track_symbols(redis_pool: aioredis.Redis, account_id: str, seen: dict[str, float], hot: bool = False):
+    """Remember which symbols an account trades (for session gating) and ask for their calendars.
+
+    `hot` also marks them in the hot set for candle polling, in the same round trip.
+    """
+    if not seen:
+        return
+    key = f"account_symbols:{account_id}"
+    ttl = config.ACCOUNT_SYMBOL_TTL_DAYS * 86400
+    cutoff = time.time() - ttl
+    pipe = redis_pool.pipeline(transaction=False)
+    if hot:
+        pipe.zadd("hot_symbols", seen)
+    pipe.zadd(key, seen, gt=True)
+    pipe.zremrangebyscore(key, "-inf", cutoff)
+    pipe.expire(key, ttl)
+    pipe.zadd("session_symbols", seen, gt=True)
+    pipe.zremrangebyscore("session_symbols", "-inf", cutoff)
+    await pipe.execute()
+
+
+async def _closed_until(redis_pool: aioredis.Redis, account_id: str) -> float | None:
+    """Queue score to defer a lightweight sync to when all of the account's symbols are closed, else None."""
+    now = time.time()
+    symbols = await redis_pool.zrange(f"account_symbols:{account_id}", 0, -1)
+    calendars = await sessions.load(redis_pool, symbols)
+    # Symbols without a calendar yet (and accounts with no known symbols) use the forex rule
+    known = [calendars.get(s) for s in symbols] or [None]
+    if any(sessions.is_open(c, now) for c in known):
+        return None
+    opens = [t for t in (sessions.next_open(c, now) for c in known) if t]
+    return min(opens + [now + config.SESSION_CLOSED_SYNC_INTERVAL])
 
 
 async def _handle_login_failure(account_id: str, error: str):
-    """Track login failures, disable sync after 3 consecutive failures."""
-    accounts = await db.fetch("accounts", {"id": f"eq.{account_id}"})
-    if accounts:
-        fail_count = accounts[0].get("sync_fail_count", 0) + 1
-        update_data = {
-            "last_sync_status": "error",
-            "last_sync_error": error,
-            "sync_fail_count": fail_count,
-        }
-        if fail_count >= 3:
-            update_data["sync_enabled"] = False
-        await db.update("accounts", {"id": account_id}, update_data)
+    """Track login failures, disable sync after 3 consecutive failures (one atomic RPC)."""
+    fail_count = await db.rpc("record_login_failure", {"p_account_id": account_id, "p_error": error})
+    if fail_count and fail_count >= 3:
+        logger.warning(f"Sync disabled for account {account_id} after {fail_count} login failures")
 
 
 if __name__ == "__main__":
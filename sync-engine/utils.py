@@ -1,5 +1,7 @@
 from datetime import datetime
 
+from models import TradeRow
+
 
 def get_session_tag(entry_time: datetime) -> str:
     """Tag a trade by forex session based on UTC hour."""
@@ -15,9 +17,9 @@ def get_session_tag(entry_time: datetime) -> str:
     return "late-ny"
 
 
-def is_market_open() -> bool:
-    """Check if forex market is open (Sun 22:00 UTC → Fri 22:00 UTC)."""
-    now = datetime.utcnow()
+def is_market_open(at: datetime | None = None) -> bool:
+    """Check if forex market is open (Sun 22:00 UTC → Fri 22:00 UTC) now or at a given UTC time."""
+    now = at or datetime.utcnow()
     weekday = now.weekday()  # Mon=0, Sun=6
     hour = now.hour
     if weekday == 4 and hour >= 22:
@@ -27,3 +29,71 @@ def is_market_open() -> bool:
     if weekday == 6 and hour < 22:
         return False
     return True
+
+
+def deals_to_trades(
+    user_id: str,
+    account_id: str,
+    deals,
+    pending: dict | None = None,
+    import_source: str = "mt5",
+    closed: dict | None = None,
+) -> list[TradeRow]:
+    """Pair MT5 entry/exit deals by position into trade rows (ticket_number = position id).
+
+    Only buy/sell deals with entry in (0=in) or out (1=out) are used. Direction and
+    entry side come from the entry deal; exits add exit price/time and accumulate
+    profit, commission and swap. A position with no exit yet is returned as an
+    open trade, unless `pending` is given, in which case it stays there for a
+    later batch to close. `closed` likewise keeps rows that already closed in an
+    earlier call, so further partial exits merge into the same row. An exit
+    without a known entry uses its own price/time for the entry side.
+    """
+    open_rows = pending if pending is not None else {}
+    closed_rows = {}
+    for d in deals:
+        if d.entry not in (0, 1) or d.type not in (0, 1):
+            continue
+        key = str(d.position_id)
+        deal_time = datetime.utcfromtimestamp(d.time)
+        row = open_rows.get(key) or closed_rows.get(key) or (closed or {}).get(key)
+
+        if row is None:
+            # An exit deal trades against the position, so flip its type for direction
+            is_buy = (d.type == 0) == (d.entry == 0)
+            row = TradeRow(
+                user_id=user_id,
+                account_id=account_id,
+                ticket_number=key,
+                symbol=d.symbol,
+                direction="buy" if is_buy else "sell",
+                entry_timestamp=deal_time.isoformat(),
+                exit_timestamp=None,
+                entry_price=float(d.price),
+                exit_price=None,
+                position_size=float(d.volume),
+                pnl=None,
+                commission=0.0,
+                swap=0.0,
+                status="open",
+                import_source=import_source,
+                session_tag=get_session_tag(deal_time),
+            )
+            open_rows[key] = row
+        elif d.entry == 0:
+            row.position_size += float(d.volume)
+
+        row.commission += float(d.commission)
+        row.swap += float(d.swap)
+        if d.entry == 1:
+            row.exit_timestamp = deal_time.isoformat()
+            row.exit_price = float(d.price)
+            row.pnl = (row.pnl or 0.0) + float(d.profit)
+            row.status = "closed"
+            closed_rows[key] = open_rows.pop(key, row)
+            if closed is not None:
+                closed[key] = row
+
+    if pending is not None:
+        return list(closed_rows.values())
+    return list(closed_rows.values()) + list(open_rows.values())